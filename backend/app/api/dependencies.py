@@ -1,21 +1,98 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta, timezone
-from typing import Optional
-from ..core.db import SessionLocal
+from typing import Dict, Optional, Tuple
+from ..core.db import get_db
 from ..models.user_model import User
+import hashlib
 import logging
+import os
+import threading
+import time
 
 # JWT settings
-SECRET_KEY = "your-secret-key"  # Change this in production!
-ALGORITHM = "HS256"
+ALGORITHM = "EdDSA"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
+ACCESS_TOKEN_EXPIRES = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+JWT_KEY_PATH = os.path.join("database", "jwt_ed25519.pem")
 
 logger = logging.getLogger(__name__)
+
+def _load_signing_key() -> Ed25519PrivateKey:
+    """Load the Ed25519 signing key from JWT_PRIVATE_KEY, or from a generated key file"""
+    pem = os.getenv("JWT_PRIVATE_KEY")
+    if pem:
+        return serialization.load_pem_private_key(pem.encode(), password=None)
+
+    if os.path.exists(JWT_KEY_PATH):
+        with open(JWT_KEY_PATH, "rb") as f:
+            return serialization.load_pem_private_key(f.read(), password=None)
+
+    # No key configured, generate one and keep it so tokens survive restarts
+    key = Ed25519PrivateKey.generate()
+    os.makedirs(os.path.dirname(JWT_KEY_PATH), exist_ok=True)
+    tmp_path = f"{JWT_KEY_PATH}.{os.getpid()}"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.NoEncryption()
+        ))
+    try:
+        # Link the complete file into place so concurrently starting workers agree on one key
+        os.link(tmp_path, JWT_KEY_PATH)
+    except FileExistsError:
+        with open(JWT_KEY_PATH, "rb") as f:
+            return serialization.load_pem_private_key(f.read(), password=None)
+    finally:
+        os.unlink(tmp_path)
+    logger.info(f"Generated new JWT signing key at {JWT_KEY_PATH}")
+    return key
+
+# Loaded once at import so encode/decode reuse the parsed key objects
+PRIVATE_KEY = _load_signing_key()
+PUBLIC_KEY = PRIVATE_KEY.public_key()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
+# Resolved tokens, keyed by token hash -> (user_id, expires_at)
+TOKEN_CACHE_TTL = 60  # seconds
+TOKEN_CACHE_MAXSIZE = 10_000
+_token_cache: Dict[bytes, Tuple[int, float]] = {}
+_token_cache_lock = threading.Lock()
+
+def _token_key(token: str) -> bytes:
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+def _get_cached_user_id(key: bytes) -> Optional[int]:
+    """Get the cached user id for a token hash if the entry has not expired"""
+    with _token_cache_lock:
+        entry = _token_cache.get(key)
+        if entry is None:
+            return None
+        if time.time() >= entry[1]:
+            _token_cache.pop(key, None)
+            return None
+        return entry[0]
+
+def _cache_user_id(key: bytes, user_id: int, exp: float):
+    """Cache a resolved user id until the TTL or the token's own expiry, whichever is first"""
+    expires_at = min(time.time() + TOKEN_CACHE_TTL, exp)
+    with _token_cache_lock:
+        if len(_token_cache) >= TOKEN_CACHE_MAXSIZE:
+            now = time.time()
+            for k in [k for k, v in _token_cache.items() if v[1] <= now]:
+                del _token_cache[k]
+            # Still full of live tokens: evict the oldest, dicts keep insertion order
+            while len(_token_cache) >= TOKEN_CACHE_MAXSIZE:
+                del _token_cache[next(iter(_token_cache))]
+        _token_cache.pop(key, None)  # Re-insert so a refreshed entry counts as newest
+        _token_cache[key] = (user_id, expires_at)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create JWT access token"""
     try:
@@ -23,25 +100,15 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         if expires_delta:
             expire = datetime.now(timezone.utc) + expires_delta
         else:
-            expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+            expire = datetime.now(timezone.utc) + ACCESS_TOKEN_EXPIRES
         to_encode.update({"exp": expire})
-        encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+        encoded_jwt = jwt.encode(to_encode, PRIVATE_KEY, algorithm=ALGORITHM)
         logger.info(f"Created access token for user: {data.get('sub')}")
         return encoded_jwt
     except Exception as e:
         logger.error(f"Error creating access token for user {data.get('sub')}: {str(e)}")
         raise
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    except Exception as e:
-        logger.error(f"Database session error: {str(e)}")
-        raise
-    finally:
-        db.close()
-
 def get_current_user(
     db: Session = Depends(get_db),
     token: str = Depends(oauth2_scheme)
@@ -52,10 +119,22 @@ def get_current_user(
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+    # Known token: skip decoding and the username lookup, load by primary key
+    key = _token_key(token)
+    user_id = _get_cached_user_id(key)
+    if user_id is not None:
+        user = db.get(User, user_id)
+        if user is not None:
+            return user
+        with _token_cache_lock:
+            _token_cache.pop(key, None)
+        raise credentials_exception
     
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, PUBLIC_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
+        uid = payload.get("uid")
         if username is None:
             logger.warning("JWT token missing username claim")
             raise credentials_exception
@@ -72,7 +151,7 @@ def get_current_user(
             logger.warning(f"Expired token attempted use for user: {username}")
             raise credentials_exception
             
-    except JWTError as e:
+    except jwt.PyJWTError as e:
         logger.error(f"JWT validation error: {str(e)}")
         raise credentials_exception
     except Exception as e:
@@ -80,11 +159,19 @@ def get_current_user(
         raise credentials_exception
     
     try:
-        user = db.query(User).filter(User.username == username).first()
+        if uid is not None:
+            user = db.get(User, uid)
+            if user is not None and user.username != username:
+                logger.warning(f"Token user id {uid} does not match username: {username}")
+                user = None
+        else:
+            # Legacy tokens issued before the uid claim was added
+            user = db.query(User).filter(User.username == username).first()
         if user is None:
             logger.warning(f"Token used with non-existent username: {username}")
             raise credentials_exception
             
+        _cache_user_id(key, user.id, exp)
         logger.debug(f"Successfully authenticated user: {username}")
         return user
         
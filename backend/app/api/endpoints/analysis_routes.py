@@ -1,375 +1,342 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from ...core.db import get_db
 from ...models.user_model import User
-from ...models.transaction_model import Transaction, Portfolio
+from ...models.transaction_model import Transaction
+from ...crud.portfolio import upsert_portfolio
 from ...schemas.data_schema import PortfolioHolding, GainLossDetail, ChartData, PerformanceData
 from ...services.analysis_service import FinanceCalculator
+from ...services.cache_service import response_cache
 from ..dependencies import get_current_user
 from datetime import datetime, timedelta
 import pandas as pd
-import json
 import logging
+from functools import lru_cache
 from typing import Dict
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+@lru_cache(maxsize=1)
+def get_calculator() -> FinanceCalculator:
+    """Get the shared calculator, so price, transaction and metrics caches persist across requests"""
+    return FinanceCalculator()
+
+# Columns the calculators read; option_type is only used for upload deduplication
+TRANSACTION_COLUMNS = [
+    'date', 'transaction_type', 'stock', 'units', 'price',
+    'fee', 'security_type', 'amount'
+]
+
+def _load_tx_df(db: Session, user_id: int) -> pd.DataFrame:
+    """Load a user's transactions into a DataFrame using a single column select"""
+    stmt = select(*(getattr(Transaction, col) for col in TRANSACTION_COLUMNS)).where(
+        Transaction.user_id == user_id,
+        Transaction.transaction_type != 'other'
+    ).order_by(Transaction.date)  # Served in order by the (user_id, date) prefix of ix_tx_dedup
+    rows = db.execute(stmt).all()
+    # Build the frame column-wise to avoid a Python object per row
+    cols = list(zip(*rows)) if rows else [()] * len(TRANSACTION_COLUMNS)
+    df = pd.DataFrame(dict(zip(TRANSACTION_COLUMNS, map(list, cols))), columns=TRANSACTION_COLUMNS)
+    # Convert dates once here so later pd.to_datetime calls on the frame are no-ops
+    df['date'] = pd.to_datetime(df['date'])
+    for col in ['units', 'price', 'fee']:
+        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0.0)
+    return df
+
+def get_transactions_version(current_user: User = Depends(get_current_user)) -> int:
+    """Get the user's transactions version, read once per request for all of its cache keys"""
+    return response_cache.get_version(current_user.id)
+
+def get_transactions_df(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    version: int = Depends(get_transactions_version)
+) -> pd.DataFrame:
+    """Get the user's transactions DataFrame, shared across endpoints and requests"""
+    cache_key = response_cache.key(current_user.id, version, "transactions")
+    cached = response_cache.get(cache_key)
+    if cached is None:
+        cached = _load_tx_df(db, current_user.id)
+        response_cache.set(cache_key, cached)
+    # Hand out copies so callers can't modify the cached frame
+    return cached.copy()
+
+def get_current_holdings(
+    df: pd.DataFrame = Depends(get_transactions_df),
+    current_user: User = Depends(get_current_user),
+    version: int = Depends(get_transactions_version)
+) -> dict:
+    """Get the user's current holdings, shared by the holdings and allocation endpoints"""
+    if df.empty:
+        return {}
+    cache_key = response_cache.key(current_user.id, version, "current_holdings")
+    holdings = response_cache.get(cache_key)
+    if holdings is None:
+        holdings = get_calculator().calculate_stock_holdings(
+            df,
+            start_date=datetime.now().date(),
+            user_id=str(current_user.id),  # Pass user_id to calculator
+            version=version
+        )
+        response_cache.set(cache_key, holdings)
+    return holdings
+
+# Responses are per user and must be revalidated with their ETag before reuse
+CACHE_CONTROL = "private, max-age=0, must-revalidate"
+
+def _cached_response(request: Request, response: Response, cache_key):
+    """Get a cached response, or a 304 if the client already has that exact response"""
+    cached = response_cache.get(cache_key)
+    if cached is None:
+        return None
+    etag = response_cache.etag(cache_key)
+    if etag is not None:
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = CACHE_CONTROL
+    return cached
+
+def _cache_response(response: Response, cache_key, result):
+    """Cache a computed response and tag it with its ETag"""
+    response_cache.set(cache_key, result)
+    etag = response_cache.etag(cache_key)
+    if etag is not None:
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = CACHE_CONTROL
+    return result
+
+# Unexpected errors propagate to the global exception handler, which logs them
+# with a traceback and returns a generic 500 without internal details
+
 @router.get("/holdings", response_model=list[PortfolioHolding])
 async def get_holdings(
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    version: int = Depends(get_transactions_version),
+    db: Session = Depends(get_db),
+    holdings: dict = Depends(get_current_holdings)
 ):
-    """Get current portfolio holdings, todo: cache for 1 minute"""
-    try:
-        # Make sure we have user_id before any processing
-        if not current_user or not current_user.id:
-            raise HTTPException(status_code=401, detail="Invalid user authentication")
-            
-        user_id = str(current_user.id)
-        
-        transactions = db.query(Transaction).filter(
-            Transaction.user_id == current_user.id,
-            Transaction.transaction_type != 'other'  # Add this filter
-        ).all()
-        
-        if not transactions:
-            return []
-            
-        # Convert to DataFrame
-        df = pd.DataFrame([{
-            'date': t.date.isoformat() if isinstance(t.date, datetime) else t.date,
-            'transaction_type': t.transaction_type,
-            'stock': t.stock,
-            'units': float(t.units) if t.units else 0.0,
-            'price': float(t.price) if t.price else 0.0,
-            'fee': float(t.fee) if t.fee else 0.0,
-            'option_type': t.option_type,
-            'security_type': t.security_type,
-            'amount': t.amount 
-        } for t in transactions])
-        
-        calculator = FinanceCalculator()
-        holdings = calculator.calculate_stock_holdings(
-            df, 
-            start_date=datetime.now().date(),
-            user_id=str(current_user.id)  # Pass user_id to calculator
-        )
-        
-        # Update portfolio table
-        existing_portfolios = {
-            p.stock: p for p in db.query(Portfolio).filter(
-                Portfolio.user_id == current_user.id
-            ).all()
-        }
+    """Get current portfolio holdings, cached per transactions version and revalidated with its ETag"""
+    # Make sure we have user_id before any processing
+    if not current_user or not current_user.id:
+        raise HTTPException(status_code=401, detail="Invalid user authentication")
         
-        # Update or create portfolio entries
-        for symbol, data in holdings.items():
-            if symbol in existing_portfolios:
-                portfolio = existing_portfolios[symbol]
-                portfolio.total_units = data['units']
-                portfolio.average_cost = data['cost_basis'] / data['units'] if data['units'] > 0 else 0
-                portfolio.current_price = data['last_price']
-                portfolio.last_updated = datetime.now().date()
-            else:
-                portfolio = Portfolio(
-                    user_id=current_user.id,
-                    stock=symbol,
-                    total_units=data['units'],
-                    average_cost=data['cost_basis'] / data['units'] if data['units'] > 0 else 0,
-                    current_price=data['last_price'],
-                    last_updated=datetime.now().date()
-                )
-                db.add(portfolio)
-        
-        try:
-            db.commit()
-        except Exception as e:
-            logger.error(f"Error updating portfolio: {str(e)}")
-            db.rollback()
-            
-        return [
-            PortfolioHolding(
-                symbol=str(symbol),
-                security_type=str(data.get("security_type", "")),
-                units=float(data.get("units", 0)),
-                last_price=float(data.get("last_price", 0)),
-                market_value=float(data.get("market_value", 0)),
-                cost_basis=float(data.get("cost_basis", 0)),
-                unrealized_gain_loss=float(data.get("unrealized_gain_loss", 0)),
-                weight=float(data.get("weight", 0))
-            )
-            for symbol, data in holdings.items()
-        ]
+    user_id = str(current_user.id)
+    cache_key = response_cache.key(user_id, version, "holdings")
+    cached = _cached_response(request, response, cache_key)
+    if cached is not None:
+        return cached
+    
+    if not holdings:
+        return []
+
+    # Update portfolio table
+    try:
+        await run_in_threadpool(upsert_portfolio, db, current_user.id, holdings)
     except Exception as e:
-        logger.error(f"Error in get_holdings: {str(e)}")
-        raise HTTPException(
-            status_code=500,
-            detail=f"Failed to fetch holdings: {str(e)}"
+        logger.error(f"Error updating portfolio: {str(e)}")
+        db.rollback()
+        
+    result = [
+        PortfolioHolding(
+            symbol=str(symbol),
+            security_type=str(data.get("security_type", "")),
+            units=float(data.get("units", 0)),
+            last_price=float(data.get("last_price", 0)),
+            market_value=float(data.get("market_value", 0)),
+            cost_basis=float(data.get("cost_basis", 0)),
+            unrealized_gain_loss=float(data.get("unrealized_gain_loss", 0)),
+            weight=float(data.get("weight", 0))
         )
+        for symbol, data in holdings.items()
+    ]
+    return _cache_response(response, cache_key, result)
 
 @router.get("/gain-loss", response_model=Dict[str, GainLossDetail])
 async def get_gain_loss(
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    version: int = Depends(get_transactions_version),
+    df: pd.DataFrame = Depends(get_transactions_df)
 ):
     """Get portfolio gain/loss analysis"""
-    try:
-        # Make sure we have user_id before any processing
-        if not current_user or not current_user.id:
-            raise HTTPException(status_code=401, detail="Invalid user authentication")
-            
-        user_id = str(current_user.id)
-        
-        transactions = db.query(Transaction).filter(
-            Transaction.user_id == current_user.id,
-            Transaction.transaction_type != 'other'  # Add this filter
-        ).all()
+    # Make sure we have user_id before any processing
+    if not current_user or not current_user.id:
+        raise HTTPException(status_code=401, detail="Invalid user authentication")
         
-        if not transactions:
-            return {}
-            
-        # Convert to DataFrame
-        df = pd.DataFrame([{
-            'date': t.date.isoformat() if isinstance(t.date, datetime) else t.date,
-            'transaction_type': t.transaction_type,
-            'stock': t.stock,
-            'units': float(t.units) if t.units else 0.0,
-            'price': float(t.price) if t.price else 0.0,
-            'fee': float(t.fee) if t.fee else 0.0,
-            'option_type': t.option_type,
-            'security_type': t.security_type,
-            'amount': t.amount
-        } for t in transactions])
-            
-        calculator = FinanceCalculator()
-        return calculator.calculate_gain_loss(df, user_id=str(current_user.id))
-        
-    except Exception as e:
-        logger.error(f"Error in get_gain_loss: {str(e)}", exc_info=True)
-        raise HTTPException(
-            status_code=500,
-            detail=f"Failed to fetch gain/loss data: {str(e)}"
-        )
+    user_id = str(current_user.id)
+    cache_key = response_cache.key(user_id, version, "gain_loss")
+    cached = _cached_response(request, response, cache_key)
+    if cached is not None:
+        return cached
+    
+    if df.empty:
+        return {}
+
+    # Calculators fetch prices and crunch frames, so keep them off the event loop
+    result = await run_in_threadpool(
+        get_calculator().calculate_gain_loss, df, user_id=str(current_user.id), version=version
+    )
+    return _cache_response(response, cache_key, result)
 
 @router.get("/allocation", response_model=ChartData)
 async def get_allocation(
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    version: int = Depends(get_transactions_version),
+    holdings: dict = Depends(get_current_holdings)
 ):
     """Get portfolio allocation chart data"""
-    try:
-        # Make sure we have user_id before any processing
-        if not current_user or not current_user.id:
-            raise HTTPException(status_code=401, detail="Invalid user authentication")
-            
-        user_id = str(current_user.id)
-        
-        transactions = db.query(Transaction).filter(
-            Transaction.user_id == current_user.id,
-            Transaction.transaction_type != 'other'  # Add this filter
-        ).all()
-        
-        if not transactions:
-            return ChartData(
-                chart_type="pie",
-                data=json.dumps({"values": [], "labels": []}),
-                title="Portfolio Allocation",
-                last_update=datetime.now()
-            )
-            
-        # Convert to DataFrame
-        df = pd.DataFrame([{
-            'date': t.date.isoformat() if isinstance(t.date, datetime) else t.date,
-            'transaction_type': t.transaction_type,
-            'stock': t.stock,
-            'units': float(t.units) if t.units else 0.0,
-            'price': float(t.price) if t.price else 0.0,
-            'fee': float(t.fee) if t.fee else 0.0,
-            'option_type': t.option_type,
-            'security_type': t.security_type,
-            'amount': t.amount
-        } for t in transactions])
-        
-        calculator = FinanceCalculator()
-        # Explicitly pass current date to get holdings
-        current_date = datetime.now().date()
-        holdings = calculator.calculate_stock_holdings(
-            df, 
-            start_date=current_date,
-            user_id=str(current_user.id)
-        )
-        
-        # Filter out zero market value positions for pie chart
-        filtered_holdings = {
-            symbol: data for symbol, data in holdings.items() 
-            if data.get('market_value', 0) > 0
-        }
-        
-        # Prepare data for pie chart
-        if filtered_holdings:
-            data = {
-                "values": [holding.get("market_value", 0) for holding in filtered_holdings.values()],
-                "labels": list(filtered_holdings.keys())
-            }
-        else:
-            data = {
-                "values": [],
-                "labels": []
-            }
+    # Make sure we have user_id before any processing
+    if not current_user or not current_user.id:
+        raise HTTPException(status_code=401, detail="Invalid user authentication")
         
+    user_id = str(current_user.id)
+    cache_key = response_cache.key(user_id, version, "allocation")
+    cached = _cached_response(request, response, cache_key)
+    if cached is not None:
+        return cached
+    
+    if not holdings:
         return ChartData(
             chart_type="pie",
-            data=json.dumps(data),
+            data={"values": [], "labels": []},
             title="Portfolio Allocation",
             last_update=datetime.now()
         )
-    except Exception as e:
-        logger.error(f"Error in get_allocation: {str(e)}")
-        raise HTTPException(
-            status_code=500,
-            detail=f"Failed to get allocation data: {str(e)}"
-        )
+
+    # Filter out zero market value positions for pie chart
+    filtered_holdings = {
+        symbol: data for symbol, data in holdings.items() 
+        if data.get('market_value', 0) > 0
+    }
+    
+    # Prepare data for pie chart
+    if filtered_holdings:
+        data = {
+            "values": [holding.get("market_value", 0) for holding in filtered_holdings.values()],
+            "labels": list(filtered_holdings.keys())
+        }
+    else:
+        data = {
+            "values": [],
+            "labels": []
+        }
+    
+    result = ChartData(
+        chart_type="pie",
+        data=data,
+        title="Portfolio Allocation",
+        last_update=datetime.now()
+    )
+    return _cache_response(response, cache_key, result)
 
 @router.get("/performance", response_model=PerformanceData)
 async def get_performance(
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    version: int = Depends(get_transactions_version),
+    df: pd.DataFrame = Depends(get_transactions_df)
 ):
     """Get portfolio performance metrics and chart data"""
-    try:
-        # Make sure we have user_id before any processing
-        if not current_user or not current_user.id:
-            raise HTTPException(status_code=401, detail="Invalid user authentication")
-            
-        user_id = str(current_user.id)
-        
-        transactions = db.query(Transaction).filter(
-            Transaction.user_id == current_user.id,
-            Transaction.transaction_type != 'other'  # Add this filter
-        ).all()
-        
-        if not transactions:
-            return PerformanceData(
-                dates=[],
-                portfolio_values=[],
-                invested_amounts=[],
-                metrics=None
-            )
-            
-        # Convert to DataFrame
-        df = pd.DataFrame([{
-            'date': t.date.isoformat() if isinstance(t.date, datetime) else t.date,
-            'transaction_type': t.transaction_type,
-            'stock': t.stock,
-            'units': float(t.units) if t.units else 0.0,
-            'price': float(t.price) if t.price else 0.0,
-            'fee': float(t.fee) if t.fee else 0.0,
-            'option_type': t.option_type,
-            'security_type': t.security_type,
-            'amount': t.amount
-        } for t in transactions])
+    # Make sure we have user_id before any processing
+    if not current_user or not current_user.id:
+        raise HTTPException(status_code=401, detail="Invalid user authentication")
         
-        calculator = FinanceCalculator()
-        return calculator.calculate_performance(df, user_id=str(current_user.id))
-        
-    except Exception as e:
-        logger.error(f"Error in get_performance: {str(e)}")
-        raise HTTPException(
-            status_code=500,
-            detail=f"Failed to fetch performance data: {str(e)}"
+    user_id = str(current_user.id)
+    cache_key = response_cache.key(user_id, version, "performance")
+    cached = _cached_response(request, response, cache_key)
+    if cached is not None:
+        return cached
+    
+    if df.empty:
+        return PerformanceData(
+            dates=[],
+            portfolio_values=[],
+            invested_amounts=[],
+            metrics=None
         )
 
+    # The calculator's shared caches are keyed on the same transactions version
+    result = await run_in_threadpool(
+        get_calculator().calculate_performance, df, user_id=str(current_user.id), version=version
+    )
+    return _cache_response(response, cache_key, result)
+
 @router.get("/annual-returns", response_model=dict)
 async def get_annual_returns(
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    version: int = Depends(get_transactions_version),
+    df: pd.DataFrame = Depends(get_transactions_df)
 ):
     """Get annual returns data for the portfolio"""
-    try:
-        # Make sure we have user_id before any processing
-        if not current_user or not current_user.id:
-            raise HTTPException(status_code=401, detail="Invalid user authentication")
-            
-        user_id = str(current_user.id)
-        
-        transactions = db.query(Transaction).filter(
-            Transaction.user_id == current_user.id,
-            Transaction.transaction_type != 'other'  # Add this filter
-        ).all()
-        
-        if not transactions:
-            return {
-                "annual_returns": []
-            }
-        
-        # Convert to DataFrame
-        df = pd.DataFrame([{
-            'date': t.date.isoformat() if isinstance(t.date, datetime) else t.date,
-            'transaction_type': t.transaction_type,
-            'stock': t.stock,
-            'units': float(t.units) if t.units else 0.0,
-            'price': float(t.price) if t.price else 0.0,
-            'fee': float(t.fee) if t.fee else 0.0,
-            'security_type': t.security_type,
-            'amount': t.amount
-        } for t in transactions])
-        
-        calculator = FinanceCalculator()
-        
-        # Get min and max years from transactions
-        df['year'] = pd.to_datetime(df['date']).dt.year
-        min_date = df['date'].min() + timedelta(days=7) #add 7 days to avoid empty account
-        max_date = df['date'].max()
-        start_year = df['year'].min()
-        end_year = df['year'].max()
-        
-        annual_returns = []
-        
-        for year in range(start_year, end_year + 1):
-            start_date = max(datetime(year, 1, 1).date(), min_date)
-            end_date = min(datetime(year, 12, 31).date(), max_date)
-
-            # Add user_id to both calls
-            price_data1 = calculator.calculate_stock_holdings(
-                df, 
-                start_date=start_date - timedelta(days=5), 
-                end_date=start_date, 
-                freq="D",
-                user_id=str(current_user.id)
-            )
-            last_date = sorted(price_data1.keys())[-1]
-            start_holdings = price_data1[last_date]
-            
-            price_data2 = calculator.calculate_stock_holdings(
-                df, 
-                start_date=end_date - timedelta(days=5), 
-                end_date=end_date, 
-                freq="D",
-                user_id=str(current_user.id)
-            )
-            last_date = sorted(price_data2.keys())[-1]
-            end_holdings = price_data2[last_date]
-
-            # Calculate total portfolio values
-            start_value = sum(holding['market_value'] for holding in start_holdings.values())
-            end_value = sum(holding['market_value'] for holding in end_holdings.values())
-            
-            # Calculate year return in dollar value
-            year_return = end_value - start_value
-            
-            annual_returns.append({
-                'year': year,
-                'return': year_return
-            })
+    # Make sure we have user_id before any processing
+    if not current_user or not current_user.id:
+        raise HTTPException(status_code=401, detail="Invalid user authentication")
         
+    user_id = str(current_user.id)
+    cache_key = response_cache.key(user_id, version, "annual_returns")
+    cached = _cached_response(request, response, cache_key)
+    if cached is not None:
+        return cached
+    
+    if df.empty:
         return {
-            "annual_returns": annual_returns
+            "annual_returns": []
         }
+
+    # Get min and max years from transactions
+    years = df['date'].dt.year
+    min_date = (df['date'].min() + timedelta(days=7)).date() #add 7 days to avoid empty account
+    max_date = df['date'].max().date()
+    start_year = years.min()
+    end_year = years.max()
     
-    except Exception as e:
-        logger.error(f"Error in get_annual_returns: {str(e)}")
-        raise HTTPException(
-            status_code=500,
-            detail=f"Failed to fetch annual returns data: {str(e)}"
+    # Holdings at every year boundary, calculated in a single batch
+    year_bounds = {
+        year: (
+            max(datetime(year, 1, 1).date(), min_date),
+            min(datetime(year, 12, 31).date(), max_date)
         )
+        for year in range(start_year, end_year + 1)
+    }
+    holdings_at = await run_in_threadpool(
+        get_calculator().calculate_stock_holdings_at,
+        df,
+        [d for bounds in year_bounds.values() for d in bounds],
+        user_id=str(current_user.id),
+        version=version
+    )
+    
+    annual_returns = []
+    
+    for year, (start_date, end_date) in year_bounds.items():
+        start_holdings = holdings_at.get(start_date, {})
+        end_holdings = holdings_at.get(end_date, {})
+
+        # Calculate total portfolio values
+        start_value = sum(holding['market_value'] for holding in start_holdings.values())
+        end_value = sum(holding['market_value'] for holding in end_holdings.values())
+        
+        # Calculate year return in dollar value
+        year_return = end_value - start_value
+        
+        annual_returns.append({
+            'year': year,
+            'return': year_return
+        })
+    
+    result = {
+        "annual_returns": annual_returns
+    }
+    return _cache_response(response, cache_key, result)
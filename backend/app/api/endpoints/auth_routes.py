@@ -1,29 +1,117 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import lambda_stmt, select
 from sqlalchemy.orm import Session
 from ...core.db import get_db
 from ...models.user_model import User
-from ..dependencies import create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
-from datetime import datetime, timedelta
+from ..dependencies import create_access_token, ACCESS_TOKEN_EXPIRES
+from datetime import datetime, timezone
 from passlib.context import CryptContext
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import hashlib
+import hmac
 import logging
+import os
+import threading
+import time
+from typing import Dict
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# New hashes use argon2id; bcrypt hashes still verify and are upgraded on login
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated="auto",
+    argon2__type="ID",
+    argon2__time_cost=2,
+    argon2__memory_cost=19456,
+    argon2__parallelism=1,
+    bcrypt__rounds=12,
+    bcrypt__ident="2b"
+)
+
+# Configured handlers, resolved once so the hot path skips the context's scheme dispatch
+_argon2 = pwd_context.handler("argon2")
+_bcrypt = pwd_context.handler("bcrypt")
+# Load the backends now rather than on the first login
+_argon2.get_backend()
+_bcrypt.get_backend()
+
+# Server-side secret mixed into argon2 hashes; must stay stable once set
+PASSWORD_PEPPER = os.getenv("PASSWORD_PEPPER", "")
+
+def _user_id_by_username(username: str):
+    """Statement selecting a user's id by username, cached after its first compile"""
+    return lambda_stmt(lambda: select(User.id).where(User.username == username).limit(1))
+
+def _user_by_username(username: str):
+    """Statement selecting a user by username, cached after its first compile"""
+    return lambda_stmt(lambda: select(User).where(User.username == username))
+
+def _pepper(password: str) -> str:
+    """Mix the server-side pepper into a password before hashing"""
+    if not PASSWORD_PEPPER:
+        return password
+    return hmac.new(PASSWORD_PEPPER.encode(), password.encode(), hashlib.sha256).hexdigest()
+
+# Per-process cache of successful verifications so repeated logins skip the KDF.
+# Failures are never cached. Keys are HMACs under a random per-process secret.
+VERIFY_CACHE_TTL = 15  # seconds
+VERIFY_CACHE_MAXSIZE = 4096
+_verify_cache: Dict[bytes, float] = {}
+_verify_cache_lock = threading.Lock()
+_verify_cache_secret = os.urandom(32)
+
+def _verify_cache_key(plain_password: str, hashed_password: str) -> bytes:
+    return hmac.new(
+        _verify_cache_secret,
+        plain_password.encode() + b"|" + hashed_password.encode(),
+        hashlib.sha256
+    ).digest()
+
+# Dedicated pool for password hashing. bcrypt and argon2 release the GIL, so threads
+# run in parallel, and bursts of logins can't exhaust the shared request threadpool.
+_kdf_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="kdf")
+
+async def _run_kdf(func, *args):
+    """Run a password hashing function on the dedicated KDF pool"""
+    return await asyncio.get_running_loop().run_in_executor(_kdf_executor, func, *args)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify password against hash"""
+    key = _verify_cache_key(plain_password, hashed_password)
+    with _verify_cache_lock:
+        expires_at = _verify_cache.get(key)
+        if expires_at is not None and time.time() < expires_at:
+            return True
+
     try:
-        return pwd_context.verify(plain_password, hashed_password)
+        # Legacy bcrypt hashes were created without the pepper
+        if _bcrypt.identify(hashed_password):
+            valid = _bcrypt.verify(plain_password, hashed_password)
+        else:
+            valid = _argon2.verify(_pepper(plain_password), hashed_password)
     except Exception as e:
         logger.error(f"Error in verify_password: {str(e)}")
         return False
 
+    if valid:
+        now = time.time()
+        with _verify_cache_lock:
+            if len(_verify_cache) >= VERIFY_CACHE_MAXSIZE:
+                for k in [k for k, v in _verify_cache.items() if v <= now]:
+                    del _verify_cache[k]
+                if len(_verify_cache) >= VERIFY_CACHE_MAXSIZE:
+                    _verify_cache.clear()
+            _verify_cache[key] = now + VERIFY_CACHE_TTL
+    return valid
+
 def get_password_hash(password: str) -> str:
     """Hash password"""
     try:
-        return pwd_context.hash(password)
+        return _argon2.hash(_pepper(password))
     except Exception as e:
         logger.error(f"Error in get_password_hash: {str(e)}")
         raise
@@ -38,7 +126,7 @@ async def signup(
         logger.info(f"Processing signup request for username: {form_data.username}")
         
         # Check if username exists
-        if db.query(User).filter(User.username == form_data.username).first():
+        if db.execute(_user_id_by_username(form_data.username)).scalar() is not None:
             logger.warning(f"Signup attempt with existing username: {form_data.username}")
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -46,11 +134,14 @@ async def signup(
             )
         
         try:
+            # Hash off the event loop
+            hashed_password = await _run_kdf(get_password_hash, form_data.password)
+
             # Create new user
             user = User(
                 username=form_data.username,
-                hashed_password=get_password_hash(form_data.password),
-                created_at=datetime.utcnow()
+                hashed_password=hashed_password,
+                created_at=datetime.now(timezone.utc)
             )
             
             db.add(user)
@@ -69,10 +160,9 @@ async def signup(
         
         try:
             # Create access token
-            access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
             access_token = create_access_token(
-                data={"sub": user.username},
-                expires_delta=access_token_expires
+                data={"sub": user.username, "uid": user.id},
+                expires_delta=ACCESS_TOKEN_EXPIRES
             )
             
             logger.info(f"Successfully created access token for new user: {form_data.username}")
@@ -109,7 +199,7 @@ async def login(
         logger.info(f"Processing login attempt for username: {form_data.username}")
         
         # Get user
-        user = db.query(User).filter(User.username == form_data.username).first()
+        user = db.execute(_user_by_username(form_data.username)).scalar_one_or_none()
         if not user:
             logger.warning(f"Login attempt with non-existent username: {form_data.username}")
             raise HTTPException(
@@ -118,8 +208,8 @@ async def login(
                 headers={"WWW-Authenticate": "Bearer"},
             )
         
-        # Verify password
-        if not verify_password(form_data.password, user.hashed_password):
+        # Verify password off the event loop
+        if not await _run_kdf(verify_password, form_data.password, user.hashed_password):
             logger.warning(f"Failed login attempt for user {form_data.username}: Invalid password")
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -128,8 +218,13 @@ async def login(
             )
         
         try:
+            # Upgrade legacy hashes now that we have the plain password
+            if pwd_context.needs_update(user.hashed_password):
+                user.hashed_password = await _run_kdf(get_password_hash, form_data.password)
+                logger.info(f"Rehashed password for user {form_data.username}")
+
             # Update last login
-            user.last_login = datetime.utcnow()
+            user.last_login = datetime.now(timezone.utc)
             db.commit()
             
         except Exception as e:
@@ -139,10 +234,9 @@ async def login(
         
         try:
             # Create access token
-            access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
             access_token = create_access_token(
-                data={"sub": user.username},
-                expires_delta=access_token_expires
+                data={"sub": user.username, "uid": user.id},
+                expires_delta=ACCESS_TOKEN_EXPIRES
             )
             
             logger.info(f"Successful login for user: {form_data.username}")
@@ -1,15 +1,86 @@
 from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Form
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from ...core.db import get_db
 from ...models.user_model import User
 from ...models.transaction_model import Transaction
 from ...services.data_service import process_csv_file
+from ...services.cache_service import response_cache
 from ..dependencies import get_current_user
-from datetime import datetime
 import pandas as pd
-import io
+import logging
+from typing import BinaryIO
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+_BROKERS = ('schwab', 'fidelity', 'etrade')
+_BROKERS_SET = frozenset(_BROKERS)
+
+def _read_csv(source: BinaryIO, skiprows: int = 0) -> pd.DataFrame:
+    """Parse an uploaded CSV file object, using the pyarrow engine when it is available"""
+    try:
+        return pd.read_csv(source, skiprows=skiprows, engine='pyarrow')
+    except (ImportError, ValueError) as e:
+        # pyarrow is optional and rejects ragged rows that broker exports often end with
+        logger.debug(f"pyarrow CSV engine unavailable, using default parser: {str(e)}")
+    source.seek(0)
+    return pd.read_csv(source, skiprows=skiprows)
+
+def _process_and_store(source: BinaryIO, broker: str, user_id: int, db: Session) -> int:
+    """Parse an upload and insert its new transactions in one commit, returning the insert count"""
+    # For E*TRADE, skip the first row as it contains account info
+    df = _read_csv(source, skiprows=1 if broker == 'etrade' else 0)
+    
+    # Process the CSV file
+    transactions_data = process_csv_file(df, broker=broker)
+
+    # Load the user's existing transaction keys once for deduplication, limited to
+    # the upload's date range so the ix_tx_dedup index serves it as a range scan
+    dates = [data['date'] for data in transactions_data]
+    existing = set(db.query(
+        Transaction.date,
+        Transaction.stock,
+        Transaction.transaction_type,
+        Transaction.security_type,
+        Transaction.option_type,
+        Transaction.amount
+    ).filter(
+        Transaction.user_id == user_id,
+        Transaction.date.between(min(dates), max(dates))
+    ).all())
+
+    # Build new transaction records, skipping ones already stored
+    rows = []
+    for data in transactions_data:
+        key = (
+            data['date'],
+            data['stock'],
+            data['transaction_type'],
+            data['security_type'],
+            data['option_type'],
+            data['amount']
+        )
+        if key in existing:
+            continue
+        rows.append({
+            'user_id': user_id,
+            'date': data['date'],
+            'stock': data['stock'],
+            'transaction_type': data['transaction_type'],
+            'units': data.get('units'),
+            'price': data.get('price'),
+            'fee': data.get('fee', 0),
+            'option_type': data.get('option_type'),
+            'security_type': data.get('security_type', 'stock'),
+            'amount': data.get('amount')
+        })
+    
+    if rows:
+        # Core executemany, skipping ORM object construction per row
+        db.execute(Transaction.__table__.insert(), rows)
+    db.commit()
+    return len(rows)
 
 @router.post("/upload")
 async def upload_file(
@@ -23,61 +94,25 @@ async def upload_file(
         raise HTTPException(status_code=400, detail="Only CSV files are supported")
     
     # Auto-detect broker if 'autodetect' is selected
-    if broker.lower() == 'autodetect':
-        if any(keyword in file.filename.lower() for keyword in ['schwab', 'fidelity', 'etrade']):
-            broker = next(keyword for keyword in ['schwab', 'fidelity', 'etrade'] if keyword in file.filename.lower())
-        else:
+    broker = broker.lower()
+    if broker == 'autodetect':
+        filename = file.filename.lower()
+        broker = next((keyword for keyword in _BROKERS if keyword in filename), None)
+        if broker is None:
             raise HTTPException(status_code=400, detail="Broker type could not be determined from the file name. Please specify the broker.")
 
-    if broker.lower() not in ['schwab', 'fidelity', 'etrade']:
+    if broker not in _BROKERS_SET:
         raise HTTPException(status_code=400, detail="Unsupported broker. Must be one of: schwab, fidelity, etrade")
     
     try:
-        # Read file contents
-        contents = await file.read()
-        
-        # For E*TRADE, skip the first row as it contains account info
-        if broker.lower() == 'etrade':
-            df = pd.read_csv(io.StringIO(contents.decode('utf-8')), skiprows=1)
-        else:
-            df = pd.read_csv(io.StringIO(contents.decode('utf-8')))
-        
-        # Process the CSV file
-        transactions_data = process_csv_file(df, broker=broker.lower())
-
-        # Create transaction records
-        for data in transactions_data:
-            # Check for existing transaction based on user_id, date, stock, transaction_type, units, and amount
-            existing_transaction = db.query(Transaction).filter(
-                Transaction.user_id == current_user.id,
-                Transaction.date == data['date'],
-                Transaction.stock == data['stock'],
-                Transaction.transaction_type == data['transaction_type'],
-                Transaction.security_type == data['security_type'],
-                Transaction.option_type == data['option_type'],
-                Transaction.amount == data['amount']
-            ).first()
-            
-            # Only add the transaction if it does not already exist
-            if not existing_transaction:
-                transaction = Transaction(
-                    user_id=current_user.id,
-                    date=data['date'] if isinstance(data['date'], datetime) else datetime.strptime(str(data['date']), '%Y-%m-%d').date(),
-                    stock=data['stock'],
-                    transaction_type=data['transaction_type'],
-                    units=data.get('units'),
-                    price=data.get('price'),
-                    fee=data.get('fee', 0),
-                    option_type=data.get('option_type'),
-                    security_type=data.get('security_type', 'stock'),
-                    amount=data.get('amount')
-                )
-                db.add(transaction)
-        
-        db.commit()
+        # Parse and store off the event loop; the spooled upload file and this
+        # request's session are only used by that one worker thread
+        inserted = await run_in_threadpool(_process_and_store, file.file, broker, current_user.id, db)
+        logger.info(f"Inserted {inserted} new transactions for user {current_user.id}")
+        response_cache.bump_version(current_user.id)
         return {"message": "File processed successfully"}
         
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An error occurred while processing the file: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"An error occurred while processing the file: {str(e)}")
@@ -1,11 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from typing import Dict, List
 from ...crud.settings import get_user_settings, update_user_settings
-from ..dependencies import get_current_user, get_db  # Changed from ...dependencies
+from ...core.db import get_db
+from ..dependencies import get_current_user
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
 from ...schemas.settings_schema import WeightSetting, WeightSettingsUpdate
+from ...services.cache_service import response_cache
 import logging
+import math
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -21,7 +24,7 @@ async def read_settings(
             raise HTTPException(status_code=401, detail="Invalid user authentication")
 
         logger.info(f"Fetching settings for user {current_user.id}")
-        settings = get_user_settings(db, current_user.id)
+        settings = await run_in_threadpool(get_user_settings, db, current_user.id)
         logger.info(f"Successfully retrieved {len(settings)} settings for user {current_user.id}")
         return settings
 
@@ -47,39 +50,36 @@ async def update_settings(
 
         logger.info(f"Processing settings update for user {current_user.id} with {len(settings.settings)} items")
 
-        # Check if total weight exceeds 100%
-        total_weight = sum(item.target_weight for item in settings.settings)
+        # Read each item once, then check if total weight exceeds 100%
+        weights = [(item.stock, item.target_weight) for item in settings.settings]
+        total_weight = math.fsum(weight for _, weight in weights)
         logger.info(f"Total weight for settings: {total_weight}")
         
         # If total exceeds 100%, normalize weights
-        if total_weight > 1.0:
+        normalize = total_weight > 1.0
+        if normalize:
             logger.warning(f"Total weight ({total_weight}) exceeds 1.0, normalizing weights")
-            normalized_settings = [
-                {
-                    "stock": item.stock,
-                    "target_weight": item.target_weight / total_weight
-                }
-                for item in settings.settings
-            ]
-        else:
-            normalized_settings = [
-                {
-                    "stock": item.stock,
-                    "target_weight": item.target_weight
-                }
-                for item in settings.settings
-            ]
+        normalized_settings = [
+            {
+                "stock": stock,
+                "target_weight": weight / total_weight if normalize else weight
+            }
+            for stock, weight in weights
+        ]
 
         try:
             # Update settings in database
-            updated_settings = update_user_settings(db, current_user.id, normalized_settings)
+            updated_settings = await run_in_threadpool(
+                update_user_settings, db, current_user.id, normalized_settings
+            )
+            response_cache.bump_version(current_user.id)
             logger.info(f"Successfully updated settings for user {current_user.id}")
 
             return {
                 "settings": updated_settings,
-                "warning": total_weight > 1.0,
+                "warning": normalize,
                 "total_weight": total_weight,
-                "normalized": total_weight > 1.0
+                "normalized": normalize
             }
 
         except Exception as e:
@@ -1,31 +1,39 @@
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-import os
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import declarative_base, sessionmaker
 import logging
+from .config import (  # Creates the database directory on import
+    SQLALCHEMY_DATABASE_URL,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW
+)
 
 logger = logging.getLogger(__name__)
 
-try:
-    # Create database directory if it doesn't exist
-    os.makedirs("database", exist_ok=True)
-    logger.info("Database directory verified")
-except Exception as e:
-    logger.error(f"Error creating database directory: {str(e)}")
-    raise
-
-SQLALCHEMY_DATABASE_URL = "sqlite:///database/sqlite.db"
-
 try:
     engine = create_engine(
         SQLALCHEMY_DATABASE_URL,
-        connect_args={"check_same_thread": False}  # Needed for SQLite
+        connect_args={"check_same_thread": False},  # Needed for SQLite
+        # Enough connections for the request threadpool so sessions don't queue on the pool
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=30
     )
     logger.info("Database engine initialized successfully")
 except Exception as e:
     logger.error(f"Error creating database engine: {str(e)}")
     raise
 
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Configure each new SQLite connection for concurrent reads and cheaper commits"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA cache_size=-65536")  # 64 MiB
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")  # 256 MiB
+    cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -33,11 +41,37 @@ def init_db():
     """Initialize database tables"""
     try:
         Base.metadata.create_all(bind=engine)
+        create_missing_indexes()
         logger.info("Database tables initialized successfully")
     except Exception as e:
         logger.error(f"Error initializing database tables: {str(e)}")
         raise
     
+def create_missing_indexes():
+    """Create indexes added to models after their tables already existed"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except Exception as e:
+                logger.error(f"Error creating index {index.name}: {str(e)}")
+    
+def warm_pool():
+    """Open the pool's connections up front so early requests don't pay for connecting"""
+    connections = []
+    try:
+        # Hold every connection until all are open, otherwise the pool hands back the same one
+        for _ in range(DB_POOL_SIZE):
+            conn = engine.connect()
+            connections.append(conn)
+            conn.execute(text("SELECT 1"))
+        logger.info(f"Warmed database pool with {len(connections)} connections")
+    except Exception as e:
+        logger.error(f"Error warming database pool: {str(e)}")
+    finally:
+        for conn in connections:
+            conn.close()
+    
 def get_db():
     """Get database session"""
     db = SessionLocal()
@@ -57,6 +91,7 @@ def migrate_db():
     """Create or update database tables"""
     try:
         Base.metadata.create_all(bind=engine)
+        create_missing_indexes()
         logger.info("Database migration completed successfully")
     except Exception as e:
         logger.error(f"Error during database migration: {str(e)}")
@@ -0,0 +1,46 @@
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+from ..models.transaction_model import Portfolio
+from datetime import date
+from typing import Dict
+import hashlib
+import threading
+import orjson
+
+# Hash of the last values written per user, so unchanged holdings skip the write
+_last_written: Dict[int, str] = {}
+_last_written_lock = threading.Lock()
+
+def upsert_portfolio(db: Session, user_id: int, holdings: Dict[str, Dict]) -> None:
+    # Write all symbols in a single INSERT ... ON CONFLICT DO UPDATE statement, skipped if unchanged
+    if not holdings:
+        return
+    today = date.today()
+    values = [
+        {
+            "user_id": user_id,
+            "stock": symbol,
+            "total_units": data['units'],
+            "average_cost": data['cost_basis'] / data['units'] if data['units'] > 0 else 0,
+            "current_price": data['last_price'],
+            "last_updated": today
+        }
+        for symbol, data in holdings.items()
+    ]
+    digest = hashlib.blake2b(orjson.dumps(values, option=orjson.OPT_SERIALIZE_NUMPY), digest_size=16).hexdigest()
+    with _last_written_lock:
+        if _last_written.get(user_id) == digest:
+            return
+
+    stmt = insert(Portfolio).values(values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'stock'],
+        set_={
+            col: stmt.excluded[col]
+            for col in ('total_units', 'average_cost', 'current_price', 'last_updated')
+        }
+    )
+    db.execute(stmt)
+    db.commit()
+    with _last_written_lock:
+        _last_written[user_id] = digest
@@ -1,63 +1,60 @@
+from sqlalchemy import and_
+from sqlalchemy.dialects.sqlite import insert
 from sqlalchemy.orm import Session
 from ..models.transaction_model import UserSettings, Portfolio
 from typing import List, Dict
+import logging
+
+logger = logging.getLogger(__name__)
 
 def get_user_settings(db: Session, user_id: int) -> List[Dict]:
-    # Get current holdings
-    holdings = db.query(Portfolio).filter(
+    # Get current holdings with their settings, if any, in one query
+    rows = db.query(Portfolio.stock, UserSettings.target_weight).outerjoin(
+        UserSettings,
+        and_(UserSettings.user_id == Portfolio.user_id, UserSettings.stock == Portfolio.stock)
+    ).filter(
         Portfolio.user_id == user_id,
         Portfolio.total_units > 0  # Only get active positions
-    ).all()
-    
-    # Get existing settings
-    settings = db.query(UserSettings).filter(UserSettings.user_id == user_id).all()
-    settings_dict = {s.stock: s.target_weight for s in settings}
+    ).order_by(Portfolio.id).all()  # Keep the holdings' insertion order
     
-    result = []
-    for holding in holdings:
-        # Initialize target weight if not exists
-        if holding.stock not in settings_dict:
-            new_setting = UserSettings(
+    # Initialize target weight for holdings without a setting
+    missing = [stock for stock, target_weight in rows if target_weight is None]
+    if missing:
+        db.add_all([
+            UserSettings(
                 user_id=user_id,
-                stock=holding.stock,
+                stock=stock,
                 target_weight=0.0  # Initialize with 0 instead of current weight
             )
-            db.add(new_setting)
-            settings_dict[holding.stock] = 0.0
-
-    # Commit new settings if any were added
-    if len(settings_dict) > len(settings):
+            for stock in missing
+        ])
         try:
             db.commit()
         except Exception as e:
-            print(f"Error committing settings: {e}")
+            logger.error(f"Error committing settings for user {user_id}: {e}")
             db.rollback()
             raise
     
     # Build result with just stock and target weight
-    for holding in holdings:
-        result.append({
-            "stock": holding.stock,
-            "target_weight": settings_dict.get(holding.stock, 0.0)
-        })
-    
-    return result
+    return [
+        {
+            "stock": stock,
+            "target_weight": target_weight if target_weight is not None else 0.0
+        }
+        for stock, target_weight in rows
+    ]
 
 def update_user_settings(db: Session, user_id: int, settings: List[Dict]) -> List[Dict]:
-    # Remove the delete statement; instead update or create each setting for one stock
-    for item in settings:
-        existing = db.query(UserSettings).filter(
-            UserSettings.user_id == user_id,
-            UserSettings.stock == item["stock"]
-        ).first()
-        if existing:
-            existing.target_weight = item["target_weight"]
-        else:
-            new_setting = UserSettings(
-                user_id=user_id,
-                stock=item["stock"],
-                target_weight=item["target_weight"]
-            )
-            db.add(new_setting)
+    # Update or create each setting for one stock in a single upsert; settings are never deleted
+    if settings:
+        stmt = insert(UserSettings).values([
+            {"user_id": user_id, "stock": item["stock"], "target_weight": item["target_weight"]}
+            for item in settings
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'stock'],
+            set_={"target_weight": stmt.excluded.target_weight}
+        )
+        db.execute(stmt)
     db.commit()
     return get_user_settings(db, user_id)
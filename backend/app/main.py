@@ -1,24 +1,38 @@
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, ORJSONResponse
 from .api.api import api_router
-from .core.db import init_db
+from .core.config import CORS_ORIGINS
+from .core.db import init_db, warm_pool
 from .core.logging_config import setup_logging
+from contextlib import asynccontextmanager
 import logging
 
 # Initialize logging
 setup_logging()
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Portfolio Visualizer API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Pre-open database connections before serving requests"""
+    await run_in_threadpool(warm_pool)
+    yield
+
+app = FastAPI(title="Portfolio Visualizer API", default_response_class=ORJSONResponse, lifespan=lifespan)
+
+# Compress larger responses such as performance series; added before CORS so CORS stays outermost
+app.add_middleware(GZipMiddleware, minimum_size=1000)
 
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["http://localhost:3000"],  # Updated to match React frontend
+    allow_origins=CORS_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+    allow_headers=["Authorization", "Content-Type", "X-User-ID", "If-None-Match"],
+    max_age=86400,  # Let browsers cache preflight responses for a day
 )
 
 # Global exception handler
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from ..core.db import Base
 
@@ -17,6 +17,15 @@ class Transaction(Base):
     security_type = Column(String)
     amount = Column(Float)
     
+    __table_args__ = (
+        # Covers the upload dedup lookup; its (user_id, date) prefix serves per-user reads
+        Index(
+            'ix_tx_dedup',
+            'user_id', 'date', 'stock', 'transaction_type',
+            'security_type', 'option_type', 'amount'
+        ),
+    )
+    
     user = relationship("User", back_populates="transactions")
 
 class Portfolio(Base):
@@ -30,6 +39,10 @@ class Portfolio(Base):
     current_price = Column(Float)
     last_updated = Column(Date)
     
+    __table_args__ = (
+        Index('ix_portfolio_user_stock', 'user_id', 'stock', unique=True),
+    )
+    
     # Relationship
     user = relationship("User", back_populates="portfolio")
 
@@ -29,7 +29,7 @@ class GainLossDetail(BaseModel):
 
 class ChartData(BaseModel):
     chart_type: str
-    data: str  # JSON string
+    data: Dict[str, Any]  # Chart values and labels
     title: str
     last_update: datetime
 
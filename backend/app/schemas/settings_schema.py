@@ -1,15 +1,13 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import List
 
 class WeightSetting(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     stock: str
     target_weight: float
 
-    class Config:
-        orm_mode = True
-
 class WeightSettingsUpdate(BaseModel):
-    settings: List[WeightSetting]
+    model_config = ConfigDict(from_attributes=True)
 
-    class Config:
-        orm_mode = True
+    settings: List[WeightSetting]
\ No newline at end of file
@@ -2,6 +2,7 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta, date
 import logging
+import threading
 from typing import Dict, List, Tuple
 from .price_service import PriceManager
 from .transaction_service import TransactionManager
@@ -15,29 +16,45 @@ class HoldingsCache:
         self._cache = {}
         self._last_calc = {}
         self._calc_interval = timedelta(minutes=1)  # Cache holdings for 1 minute
+        self._lock = threading.Lock()  # Calculations run on threadpool workers
 
-    def get(self, key: Tuple[date, str]) -> dict:
+    def get(self, key: Tuple[str, int, date]) -> dict:
         """Get cached holdings if not expired"""
-        if key in self._cache and datetime.now() - self._last_calc[key] < self._calc_interval:
-            return self._cache[key]
+        if key[1] < 0:
+            return None
+        with self._lock:
+            if key in self._cache and datetime.now() - self._last_calc[key] < self._calc_interval:
+                return self._cache[key]
         return None
 
-    def set(self, key: Tuple[date, str], value: dict):
+    def set(self, key: Tuple[str, int, date], value: dict):
         """Cache holdings calculation result"""
-        self._cache[key] = value
-        self._last_calc[key] = datetime.now()
+        if key[1] < 0:
+            return
+        with self._lock:
+            self._cache[key] = value
+            self._last_calc[key] = datetime.now()
 
     def clear(self):
         """Clear expired cache entries"""
         current_time = datetime.now()
-        self._cache = {
-            k: v for k, v in self._cache.items()
-            if current_time - self._last_calc[k] < self._calc_interval
-        }
-        self._last_calc = {
-            k: v for k, v in self._last_calc.items()
-            if current_time - v < self._calc_interval
-        }
+        with self._lock:
+            self._cache = {
+                k: v for k, v in self._cache.items()
+                if current_time - self._last_calc[k] < self._calc_interval
+            }
+            self._last_calc = {
+                k: v for k, v in self._last_calc.items()
+                if current_time - v < self._calc_interval
+            }
+
+def _cash_amounts(group: pd.DataFrame, fallback: pd.Series, absolute: bool = True) -> pd.Series:
+    """Get each row's cash amount, using the fallback for rows without a non-zero amount"""
+    amount = pd.to_numeric(group['amount'], errors='coerce')
+    has_amount = amount.notna() & (amount != 0)
+    if absolute:
+        amount = amount.abs()
+    return amount.where(has_amount, fallback.to_numpy())
 
 class TransactionProcessor:
     """Process and optimize transaction calculations"""
@@ -57,10 +74,61 @@ class TransactionProcessor:
         self.symbol_groups = self.df.groupby('stock')
         # Store unique symbols
         self.symbols = set(self.df['stock'].unique()) - {'CASH EQUIVALENTS'}
-
-    def get_transactions_until(self, calc_date: date) -> pd.DataFrame:
-        """Get transactions up to a specific date efficiently"""
-        return self.df[self.df['date'].dt.date <= calc_date]
+        self._group_totals = None
+
+    def _build_group_totals(self) -> list:
+        """Build running totals per (stock, transaction type) group, in groupby order"""
+        df = self.df
+        units = df['units']
+        price = df['price']
+        fee = df['fee']
+        valid = units.notna() & price.notna()
+        # Per-row contributions; NaN counts as 0 like it does in a group sum
+        columns = {
+            'units': units.where(valid, 0.0),
+            'cost': (units * price).where(valid, 0.0) + fee.where(valid, 0.0).fillna(0.0),
+            'buy_cash': _cash_amounts(df, units * price + fee),
+            'sell_cash': _cash_amounts(df, units * price - fee),
+            'transfer_cash': _cash_amounts(df, units, absolute=False),
+            'income_cash': _cash_amounts(df, units),
+            'split_units': units.where(units.notna() & (units != 0), 0.0)
+        }
+        columns = {col: values.fillna(0.0).to_numpy(dtype=float) for col, values in columns.items()}
+        days = df['date'].dt.normalize().to_numpy()
+        security_types = df['security_type'].to_numpy()
+
+        group_totals = []
+        groups = df.reset_index(drop=True).groupby(['stock', 'transaction_type']).indices
+        for symbol, txn_type in sorted(groups):
+            positions = groups[(symbol, txn_type)]
+            group_totals.append((
+                symbol,
+                txn_type,
+                security_types[positions[0]],
+                days[positions],
+                {col: np.cumsum(values[positions]) for col, values in columns.items()}
+            ))
+        return group_totals
+
+    def get_group_totals_until(self, calc_date: date) -> List[Tuple[str, str, str, dict]]:
+        """Get each (stock, transaction type) group's totals over transactions up to a date
+
+        Running totals are built once, so each date only costs a binary search per group.
+        """
+        if self._group_totals is None:
+            self._group_totals = self._build_group_totals()
+        day = np.datetime64(calc_date, 'ns')
+        totals = []
+        for symbol, txn_type, security_type, days, cumulative in self._group_totals:
+            count = days.searchsorted(day, side='right')
+            if count:
+                totals.append((
+                    symbol,
+                    txn_type,
+                    security_type,
+                    {col: values[count - 1] for col, values in cumulative.items()}
+                ))
+        return totals
 
     def get_symbols_requiring_prices(self) -> List[str]:
         """Get list of symbols requiring price data"""
@@ -115,13 +183,14 @@ class FinanceCalculator:
                 if prices_df is not None and calc_date is not None:
                     # Get historical price from batch data
                     try:
-                        price_series = prices_df[symbol] if symbol in prices_df.columns else pd.Series()
-                        if not price_series.empty:
-                            # Convert calc_date to Timestamp and find the last valid price
-                            calc_timestamp = pd.Timestamp(calc_date)
-                            valid_prices = price_series[price_series.index <= calc_timestamp]
-                            if not valid_prices.empty:
-                                data['last_price'] = float(valid_prices.iloc[-1])
+                        if symbol in prices_df.columns:
+                            # Prices are sorted and forward filled, so the last row on or
+                            # before calc_date holds the last valid price
+                            price_series = prices_df[symbol]
+                            position = price_series.index.searchsorted(pd.Timestamp(calc_date), side='right')
+                            last_price = price_series.iat[position - 1] if position else np.nan
+                            if pd.notna(last_price):
+                                data['last_price'] = float(last_price)
                             else:
                                 self.logger.warning(f"No price found for {symbol} on {calc_date}")
                                 data['last_price'] = 0.0
@@ -147,7 +216,7 @@ class FinanceCalculator:
         
         return holdings
 
-    def calculate_stock_holdings(self, df: pd.DataFrame, start_date: date = None, end_date: date = None, freq: str = 'D', user_id: str = None) -> dict:
+    def calculate_stock_holdings(self, df: pd.DataFrame, start_date: date = None, end_date: date = None, freq: str = 'D', user_id: str = None, version: int = 0) -> dict:
         """Calculate stock holdings for given date(s)
         
         Args:
@@ -157,6 +226,7 @@ class FinanceCalculator:
             freq: Frequency for calculations ('D' for daily, 'W' for weekly, 'M' for monthly)
                 Only used when both start_date and end_date are provided
             user_id: User ID for transaction processing
+            version: The user's transactions version, identifying df in the shared caches
                 
         Returns:
             If only start_date provided: Dictionary of holdings for that date
@@ -171,7 +241,7 @@ class FinanceCalculator:
                 user_id = "default"
 
             # Pre-process transactions
-            processed_df = self.transaction_manager.preprocess_transactions(df.copy(), user_id=user_id)
+            processed_df = self.transaction_manager.preprocess_transactions(df.copy(), user_id=user_id, version=version)
 
             # Initialize processor with processed transactions
             processor = TransactionProcessor(processed_df)
@@ -194,16 +264,13 @@ class FinanceCalculator:
             prices_df = pd.DataFrame()
             if price_symbols:
                 try:
-                    tmp = end_date + timedelta(days=1) if end_date else start_date + timedelta(days=1)
-                    print(f"Start date: {start_date- timedelta(days=5)}, End date: {tmp}")
                     prices_df = self.price_manager.get_prices_batch(
                         price_symbols,
                         start_date - timedelta(days=5),
                         end_date + timedelta(days=1) if end_date else start_date + timedelta(days=1)
                     )
-                    print("Prices DataFrame:")
-                    print(prices_df)
-                    
+                    # Carry each price forward so any date reads its last known price directly
+                    prices_df = prices_df.sort_index().ffill()
                 except Exception as e:
                     self.logger.error(f"Error in batch price download: {str(e)}")
                     return {} if end_date is None else {start_date: {}}
@@ -215,18 +282,15 @@ class FinanceCalculator:
                 calc_date = calc_date.date()
                 
                 # Check cache first
-                cache_key = (calc_date, 'holdings')
+                cache_key = (user_id, version, calc_date)
                 cached_holdings = self.holdings_cache.get(cache_key)
                 if cached_holdings is not None:
                     holdings_by_date[calc_date] = cached_holdings
                     continue
 
-                # Get transactions up to date efficiently
-                transactions_to_date = processor.get_transactions_until(calc_date)
-                
-                # Calculate holdings
+                # Calculate holdings from the running totals up to date
                 holdings = self._calculate_holdings_for_date(
-                    transactions_to_date,
+                    processor.get_group_totals_until(calc_date),
                     calc_date,
                     prices_df
                 )
@@ -243,8 +307,61 @@ class FinanceCalculator:
             self.logger.error(f"Error in calculate_stock_holdings for user {user_id}: {e}")
             return {} if end_date is None else {start_date: {}}
 
-    def _calculate_holdings_for_date(self, transactions: pd.DataFrame, calc_date: date, prices_df: pd.DataFrame) -> dict:
-        """Calculate holdings for a specific date using vectorized operations where possible"""
+    def calculate_stock_holdings_at(self, df: pd.DataFrame, dates: List[date], user_id: str = None, version: int = 0) -> Dict[date, dict]:
+        """Calculate stock holdings for a set of arbitrary dates in one pass
+        
+        Transactions are preprocessed and prices are fetched once for the whole
+        span of dates, instead of once per date as with calculate_stock_holdings.
+        
+        Args:
+            df: Transaction DataFrame
+            dates: Dates to calculate holdings for
+            user_id: User ID for transaction processing
+            version: The user's transactions version, identifying df in the shared caches
+                
+        Returns:
+            Dictionary with dates as keys and holdings dictionaries as values
+        """
+        dates = sorted(set(dates))
+        try:
+            if df.empty or not dates:
+                return {calc_date: {} for calc_date in dates}
+
+            if user_id is None:
+                self.logger.warning("No user_id provided for holdings calculation")
+                user_id = "default"
+
+            processed_df = self.transaction_manager.preprocess_transactions(df.copy(), user_id=user_id, version=version)
+            processor = TransactionProcessor(processed_df)
+
+            prices_df = pd.DataFrame()
+            price_symbols = processor.get_symbols_requiring_prices()
+            if price_symbols:
+                try:
+                    prices_df = self.price_manager.get_prices_batch(
+                        price_symbols,
+                        dates[0] - timedelta(days=5),
+                        dates[-1] + timedelta(days=1)
+                    )
+                    prices_df = prices_df.sort_index().ffill()
+                except Exception as e:
+                    self.logger.error(f"Error in batch price download: {str(e)}")
+                    return {calc_date: {} for calc_date in dates}
+
+            return {
+                calc_date: self._calculate_holdings_for_date(
+                    processor.get_group_totals_until(calc_date),
+                    calc_date,
+                    prices_df
+                )
+                for calc_date in dates
+            }
+        except Exception as e:
+            self.logger.error(f"Error in calculate_stock_holdings_at for user {user_id}: {e}")
+            return {calc_date: {} for calc_date in dates}
+
+    def _calculate_holdings_for_date(self, group_totals: List[Tuple[str, str, str, dict]], calc_date: date, prices_df: pd.DataFrame) -> dict:
+        """Calculate holdings for a specific date from per (stock, transaction type) totals up to it"""
         try:
             holdings = {
                 'CASH EQUIVALENTS': {
@@ -256,39 +373,26 @@ class FinanceCalculator:
                 }
             }
 
-            # Group transactions by symbol and type for vectorized calculations
-            grouped = transactions.groupby(['stock', 'transaction_type'])
-            
-            # Calculate positions using vectorized operations
-            for (symbol, txn_type), group in grouped:
+            # Calculate positions from each group's totals
+            for symbol, txn_type, security_type, totals in group_totals:
                 if symbol not in holdings and symbol != 'CASH EQUIVALENTS':
                     holdings[symbol] = {
                         'units': 0.0,
-                        'security_type': group.iloc[0]['security_type'],
+                        'security_type': security_type,
                         'cost_basis': 0.0,
                         'last_price': 0.0,
                         'last_update': calc_date
                     }
                 
                 if txn_type.lower() in ['buy', 'reinvest', 'stock_transfer']:
-                    mask = pd.notna(group['units']) & pd.notna(group['price'])
-                    holdings[symbol]['units'] += group[mask]['units'].sum()
-                    holdings[symbol]['cost_basis'] += (
-                        (group[mask]['units'] * group[mask]['price']).sum() + 
-                        group[mask]['fee'].sum()
-                    )
+                    holdings[symbol]['units'] += totals['units']
+                    holdings[symbol]['cost_basis'] += totals['cost']
                     
                     if txn_type != 'stock_transfer':
-                        cash_impact = group.apply(
-                            lambda x: abs(x['amount']) if pd.notna(x['amount']) and x['amount']!=0 
-                            else (x['units'] * x['price'] + x['fee']),
-                            axis=1
-                        ).sum()
-                        holdings['CASH EQUIVALENTS']['units'] -= cash_impact
+                        holdings['CASH EQUIVALENTS']['units'] -= totals['buy_cash']
                 
                 elif txn_type.lower() == 'sell':
-                    mask = pd.notna(group['units']) & pd.notna(group['price'])
-                    sell_units = group[mask]['units'].sum()
+                    sell_units = totals['units']
                     if sell_units > 0:
                         # Calculate cost basis per unit
                         cost_per_unit = holdings[symbol]['cost_basis'] / holdings[symbol]['units'] if holdings[symbol]['units'] != 0 else 0
@@ -297,47 +401,27 @@ class FinanceCalculator:
                         holdings[symbol]['units'] -= sell_units
 
                     # Update cash position with proceeds
-                    proceeds = group.apply(
-                        lambda x: abs(x['amount']) if pd.notna(x['amount']) and x['amount']!=0 
-                        else (x['units'] * x['price'] - x['fee']),
-                        axis=1
-                    ).sum()
-                    holdings['CASH EQUIVALENTS']['units'] += proceeds
-
-                elif txn_type.lower() == 'transfer' and group.iloc[0]['security_type'] == 'cash':
+                    holdings['CASH EQUIVALENTS']['units'] += totals['sell_cash']
+
+                elif txn_type.lower() == 'transfer' and security_type == 'cash':
                     # Handle cash transfers
-                    transfer_amount = group.apply(
-                        lambda x: x['amount'] if pd.notna(x['amount']) and x['amount']!=0 
-                        else x['units'],
-                        axis=1
-                    ).sum()
-                    holdings['CASH EQUIVALENTS']['units'] += transfer_amount
+                    holdings['CASH EQUIVALENTS']['units'] += totals['transfer_cash']
                 
                 elif txn_type.lower() in ['dividend', 'interest']:
                     # Handle dividend and interest income
-                    income_amount = group.apply(
-                        lambda x: abs(x['amount']) if pd.notna(x['amount']) and x['amount']!=0 
-                        else x['units'],
-                        axis=1
-                    ).sum()
-                    holdings['CASH EQUIVALENTS']['units'] += income_amount
+                    holdings['CASH EQUIVALENTS']['units'] += totals['income_cash']
                 
                 elif txn_type.lower() in ['sell_to_open', 'sell_to_close', 'buy_to_open', 'buy_to_close']:
                     # Handle option transactions
-                    premium = group.apply(
-                        lambda x: abs(x['amount']) if pd.notna(x['amount']) and x['amount']!=0 
-                        else (x['units'] * x['price'] - x['fee']),
-                        axis=1
-                    ).sum()
+                    premium = totals['sell_cash']
                     if txn_type.lower() in ['sell_to_open', 'sell_to_close']:
                         holdings['CASH EQUIVALENTS']['units'] += premium
                     else:
                         holdings['CASH EQUIVALENTS']['units'] -= premium
                 
-                elif txn_type.lower() == 'split' and group.iloc[0]['security_type'] == 'stock':
+                elif txn_type.lower() == 'split' and security_type == 'stock':
                     # Handle stock splits
-                    split_units = group[pd.notna(group['units']) & (group['units'] != 0)]['units'].sum()
-                    holdings[symbol]['units'] += split_units
+                    holdings[symbol]['units'] += totals['split_units']
 
             # Update cash position cost basis
             holdings['CASH EQUIVALENTS']['cost_basis'] = holdings['CASH EQUIVALENTS']['units']
@@ -350,17 +434,19 @@ class FinanceCalculator:
             self.logger.error(f"Error in _calculate_holdings_for_date for date {calc_date}: {e}")
             return {}
 
-    def calculate_gain_loss(self, df: pd.DataFrame, user_id: str = None) -> dict:
+    def calculate_gain_loss(self, df: pd.DataFrame, user_id: str = None, version: int = 0) -> dict:
         """Calculate realized and unrealized gains/losses for all positions"""
         try:
             if df.empty:
                 return {}
                 
             # Pre-process transactions
-            processed_df = self.transaction_manager.preprocess_transactions(df.copy(), user_id=user_id)
+            processed_df = self.transaction_manager.preprocess_transactions(df.copy(), user_id=user_id, version=version)
+            
+            now = datetime.now()
             
             # Get current holdings first (use single date mode)
-            holdings = self.calculate_stock_holdings(processed_df, start_date=datetime.now().date(),user_id=user_id)
+            holdings = self.calculate_stock_holdings(processed_df, start_date=now.date(),user_id=user_id, version=version)
             
             # Initialize gain/loss tracking
             gain_loss = {}
@@ -406,7 +492,7 @@ class FinanceCalculator:
                 current_holding = holdings.get(symbol, {
                     'units': 0,
                     'last_price': 0,
-                    'last_update': datetime.now()
+                    'last_update': now
                 })
                 
                 # For cash, reset cost basis to units
@@ -458,14 +544,21 @@ class FinanceCalculator:
                 user_id = "default"
             
             holdings_by_date = {}
+
+            # Sort once and keep running cash totals, so each date is a binary search
+            df = df.sort_values('date', kind='stable')
+            days = pd.to_datetime(df['date']).values.astype('datetime64[D]')
+            is_cash_flow = (df['security_type'] == 'cash') & df['transaction_type'].str.lower().isin(['transfer', 'dividend', 'interest'])
+            cash_flows = df['amount'].where(df['amount'].notna(), df['units']).where(is_cash_flow, 0.0)
+            running_cash = np.cumsum(cash_flows.to_numpy(dtype=float))
             
             for calc_date in date_range:
                 calc_date = calc_date.date()
-                transactions_to_date = df[pd.to_datetime(df['date']).dt.date <= calc_date].copy()
+                count = days.searchsorted(np.datetime64(calc_date, 'D'), side='right')
                 
                 holdings = {
                     'CASH EQUIVALENTS': {
-                        'units': 0.0,
+                        'units': float(running_cash[count - 1]) if count else 0.0,
                         'security_type': 'cash',
                         'cost_basis': 0.0,
                         'last_price': 1.0,
@@ -475,12 +568,6 @@ class FinanceCalculator:
                     }
                 }
                 
-                # Process only cash transactions
-                for _, row in transactions_to_date.sort_values('date').iterrows():
-                    if row['security_type'] == 'cash':
-                        if row['transaction_type'].lower() in ['transfer', 'dividend', 'interest']:
-                            holdings['CASH EQUIVALENTS']['units'] += row['amount'] if pd.notna(row['amount']) else row['units']
-                
                 holdings['CASH EQUIVALENTS']['cost_basis'] = holdings['CASH EQUIVALENTS']['units']
                 holdings['CASH EQUIVALENTS']['market_value'] = holdings['CASH EQUIVALENTS']['units']
                 
@@ -491,7 +578,7 @@ class FinanceCalculator:
             self.logger.error(f"Error in _calculate_holdings_without_prices for user {user_id}: {e}")
             return {}
 
-    def calculate_performance(self, df: pd.DataFrame, user_id: str = None) -> dict:
+    def calculate_performance(self, df: pd.DataFrame, user_id: str = None, version: int = 0) -> dict:
         """Calculate portfolio performance metrics over time using weekly intervals"""
         try:
             if df.empty:
@@ -510,8 +597,8 @@ class FinanceCalculator:
             start_date = pd.to_datetime(df['date'].min()).date()
             end_date = pd.to_datetime(df['date'].max()).date()
             
-            # Check cache first
-            cached_metrics = self.metrics_cache.get(user_id, 'performance', start_date, end_date)
+            # Check cache first; entries from older transaction versions don't match
+            cached_metrics = self.metrics_cache.get(user_id, 'performance', start_date, end_date, version)
             if cached_metrics:
                 return cached_metrics
             
@@ -519,7 +606,7 @@ class FinanceCalculator:
             df = df.sort_values('date')
             
             # Calculate holdings for all weeks with user_id
-            holdings_by_date = self.calculate_stock_holdings(df, start_date, end_date, freq='W', user_id=user_id)
+            holdings_by_date = self.calculate_stock_holdings(df, start_date, end_date, freq='W', user_id=user_id, version=version)
             
             if not holdings_by_date:
                 return {
@@ -530,27 +617,35 @@ class FinanceCalculator:
                 }
             
             # Extract values
-            dates = []
-            daily_values = []
-            daily_invested = []
+            dates = sorted(holdings_by_date)
+            # Calculate total portfolio value (includes cash, stocks, and fixed income)
+            daily_values = [
+                float(sum(holding['market_value'] for holding in holdings_by_date[calc_date].values()))
+                for calc_date in dates
+            ]
             
-            for calc_date, holdings in sorted(holdings_by_date.items()):
-                # Calculate total portfolio value (includes cash, stocks, and fixed income)
-                total_value = sum(holding['market_value'] for holding in holdings.values())
-                
-                # Calculate invested amount up to this date (only cash transfers, and employee stock transfer in Etrade)
-                transactions_to_date = df[pd.to_datetime(df['date']).dt.date <= calc_date]
-                invested_amount = 0
-                for _, txn in transactions_to_date.iterrows():
-                    if txn['transaction_type'].lower() == 'transfer' and txn['security_type'] == 'cash':
-                        transfer_amount = txn['amount'] if pd.notna(txn['amount']) else txn['units']
-                        invested_amount += transfer_amount
-                    elif txn['transaction_type'].lower() == 'stock_transfer':
-                        invested_amount += txn['price'] * txn['units']
-                
-                dates.append(calc_date)
-                daily_values.append(float(total_value))  # Ensure float type
-                daily_invested.append(float(invested_amount))  # Ensure float type
+            # Calculate invested amount up to each date (only cash transfers, and employee stock transfer in Etrade)
+            txn_types = df['transaction_type'].str.lower()
+            amount = pd.to_numeric(df['amount'], errors='coerce')
+            contribution = np.select(
+                [
+                    (txn_types == 'transfer') & (df['security_type'] == 'cash'),
+                    txn_types == 'stock_transfer'
+                ],
+                [
+                    amount.where(amount.notna(), df['units']),
+                    df['price'] * df['units']
+                ],
+                default=0.0
+            )
+            # df is sorted by date, so a running total looked up by date gives the amount to date
+            invested_to_row = np.cumsum(contribution)
+            txn_days = pd.to_datetime(df['date']).to_numpy(dtype='datetime64[D]')
+            counts = txn_days.searchsorted(np.array(dates, dtype='datetime64[D]'), side='right')
+            daily_invested = [
+                float(invested_to_row[count - 1]) if count else 0.0
+                for count in counts
+            ]
             
             # Convert to numpy arrays for calculations
             values = np.array(daily_values)
@@ -619,7 +714,7 @@ class FinanceCalculator:
             }
             
             # Cache the results before returning
-            self.metrics_cache.set(user_id, 'performance', start_date, end_date, result)
+            self.metrics_cache.set(user_id, 'performance', start_date, end_date, result, version)
             
             return result
         except Exception as e:
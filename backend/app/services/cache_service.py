@@ -0,0 +1,106 @@
+import sqlite3
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Optional, Tuple
+from ..core.cache_config import get_cache_path
+
+logger = logging.getLogger(__name__)
+
+class ResponseCache:
+    """Cache for per-user analysis responses, invalidated by a transactions version"""
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._memory_cache = {}
+        self._last_calc = {}
+        self._cache_interval = timedelta(minutes=1)  # Cache responses for 1 minute
+        self._lock = threading.Lock()
+        self.db_path = get_cache_path()
+        self._init_db()
+
+    def _init_db(self):
+        """Initialize SQLite table for per-user transactions versions"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS transactions_version (
+                        user_id TEXT PRIMARY KEY,
+                        version INTEGER NOT NULL DEFAULT 0
+                    )
+                """)
+        except Exception as e:
+            self.logger.error(f"Error in _init_db initializing response cache DB: {e}")
+
+    def get_version(self, user_id: str) -> int:
+        """Get the current transactions version for a user"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.execute(
+                    "SELECT version FROM transactions_version WHERE user_id = ?",
+                    (str(user_id),)
+                )
+                result = cursor.fetchone()
+                return result[0] if result else 0
+        except Exception as e:
+            self.logger.error(f"Error in get_version for user {user_id}: {e}")
+            return -1
+
+    def bump_version(self, user_id: str):
+        """Invalidate all cached responses for a user by incrementing the version"""
+        user_id = str(user_id)
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute("""
+                    INSERT INTO transactions_version (user_id, version) VALUES (?, 1)
+                    ON CONFLICT(user_id) DO UPDATE SET version = version + 1
+                """, (user_id,))
+        except Exception as e:
+            self.logger.error(f"Error in bump_version for user {user_id}: {e}")
+
+        # Drop this process's stale entries right away instead of waiting for expiry
+        with self._lock:
+            for key in [k for k in self._memory_cache if k[0] == user_id]:
+                self._memory_cache.pop(key, None)
+                self._last_calc.pop(key, None)
+
+    def key(self, user_id: str, version: int, endpoint: str) -> Tuple[str, int, str]:
+        """Build a cache key from the user id, the user's transactions version and the endpoint"""
+        return (str(user_id), version, endpoint)
+
+    def get(self, key: Tuple[str, int, str]) -> Optional[Any]:
+        """Get cached response if not expired"""
+        if key[1] < 0:
+            return None
+        with self._lock:
+            if key in self._memory_cache and datetime.now() - self._last_calc[key] < self._cache_interval:
+                return self._memory_cache[key]
+        return None
+
+    def etag(self, key: Tuple[str, int, str]) -> Optional[str]:
+        """Get an ETag identifying the cached response for a key, if there is one"""
+        with self._lock:
+            calc_time = self._last_calc.get(key)
+        if calc_time is None:
+            return None
+        digest = hashlib.blake2b(repr((key, calc_time)).encode(), digest_size=8).hexdigest()
+        return f'"{digest}"'
+
+    def set(self, key: Tuple[str, int, str], value: Any):
+        """Cache a computed response"""
+        if key[1] < 0:
+            return
+        with self._lock:
+            self._memory_cache[key] = value
+            self._last_calc[key] = datetime.now()
+            self._clear_expired()
+
+    def _clear_expired(self):
+        """Clear expired cache entries, caller must hold the lock"""
+        current_time = datetime.now()
+        for key in [k for k, v in self._last_calc.items() if current_time - v >= self._cache_interval]:
+            self._memory_cache.pop(key, None)
+            self._last_calc.pop(key, None)
+
+response_cache = ResponseCache()
@@ -1,12 +1,12 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+from functools import lru_cache
 import logging
 from typing import List, Dict, Any, Optional
 import os
 import re
 import warnings
-import yfinance as yf
 import io
 
 logger = logging.getLogger(__name__)
@@ -20,17 +20,18 @@ def process_csv_file(df: pd.DataFrame, broker: str = 'schwab') -> List[Dict[str,
         transactions = []
         skipped_rows = 0
         
-        for idx, row in df.iterrows():
+        # Plain dict records; the row processors only use dict access
+        for idx, row in enumerate(df.to_dict('records')):
             try:
                 # First check if the raw line is valid before processing
-                raw_line = ','.join(str(v) for v in row.values)
+                raw_line = ','.join(str(v) for v in row.values())
                 if not data_service.is_valid_line(raw_line, broker):
                     skipped_rows += 1
                     logger.debug(f"process_csv_file: Skipping invalid line {idx}: {raw_line[:100]}...")
                     continue
                 
                 # Skip invalid rows
-                if not data_service.is_valid_row(row.to_dict(), broker):
+                if not data_service.is_valid_row(row, broker):
                     skipped_rows += 1
                     continue
                 
@@ -67,6 +68,9 @@ def process_csv_file(df: pd.DataFrame, broker: str = 'schwab') -> List[Dict[str,
         if not data_service.validate_data(df_processed):
             raise ValueError("Data validation failed")
         
+        # Convert the whole date column to plain dates once, instead of per record downstream
+        df_processed['date'] = pd.to_datetime(df_processed['date']).dt.date
+        
         return df_processed.to_dict('records')
     except Exception as e:
         logger.error(f"Error in process_csv_file: {str(e)}")
@@ -183,8 +187,9 @@ class DataService:
         return symbol
 
     @staticmethod
+    @lru_cache(maxsize=4096)
     def standardize_dates(date_str: str) -> datetime:
-        """Convert various date formats to datetime object."""
+        """Convert various date formats to datetime object, caching repeated strings."""
         if pd.isna(date_str):
             raise ValueError("Date cannot be null")
             
@@ -224,23 +229,24 @@ class DataService:
             df_cleaned.loc[df_cleaned['security_type'] != 'option', 'option_type'] = None
             
             # Handle special cases
-            for idx, row in df_cleaned.iterrows():
-                # For assigned options, derive price if missing
-                if row['transaction_type'] == 'assigned' and pd.isna(row['price']):
-                    if 'Description' in df_cleaned.columns:
-                        desc = str(row['Description'])
-                        strike_match = re.search(r'\$(\d+(\.\d+)?)', desc)
-                        if strike_match:
-                            df_cleaned.loc[idx, 'price'] = float(strike_match.group(1))
-                
-                # For cash equivalents and fixed income redemptions
-                if row['security_type'] in ['cash', 'fixed_income'] and pd.isna(row['price']):
-                    if row['transaction_type'] in self.CASH_AFFECTING_TYPES:
-                        df_cleaned.loc[idx, 'price'] = 1.0
-                
-                # For stock splits
-                if row['transaction_type'] == 'split' and pd.isna(row['price']):
-                    df_cleaned.loc[idx, 'price'] = 0.0
+            missing_price = df_cleaned['price'].isna()
+            
+            # For assigned options, derive price from the strike in the description
+            if 'Description' in df_cleaned.columns:
+                assigned = missing_price & (df_cleaned['transaction_type'] == 'assigned')
+                strikes = df_cleaned.loc[assigned, 'Description'].astype(str).str.extract(r'\$(\d+(\.\d+)?)')[0]
+                df_cleaned.loc[strikes.dropna().index, 'price'] = strikes.dropna().astype(float)
+            
+            # For cash equivalents and fixed income redemptions
+            cash_like = (
+                missing_price
+                & df_cleaned['security_type'].isin(['cash', 'fixed_income'])
+                & df_cleaned['transaction_type'].isin(self.CASH_AFFECTING_TYPES)
+            )
+            df_cleaned.loc[cash_like, 'price'] = 1.0
+            
+            # For stock splits
+            df_cleaned.loc[missing_price & (df_cleaned['transaction_type'] == 'split'), 'price'] = 0.0
             
             # Drop rows with missing critical values
             critical_columns = ['date', 'transaction_type', 'stock']
@@ -587,6 +593,8 @@ class DataService:
             price = float(str(row.get('Price', 0)).replace('$', '').replace(',', ''))
             if transaction_type in ['stock_transfer', 'reinvest'] and price == 0:
                 try:
+                    import yfinance as yf  # Deferred, it is slow to import and rarely needed here
+
                     date = pd.to_datetime(row['TransactionDate'])
                     last_day_prev_month = (date.replace(day=1) - timedelta(days=1))
                     
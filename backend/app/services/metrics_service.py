@@ -14,6 +14,7 @@ class MetricsCache:
         self.logger = logging.getLogger(__name__)
         self._memory_cache = {}
         self._last_calc = {}
+        self._versions = {}
         self._cache_interval = timedelta(hours=24)  # Cache metrics for 24 hours
         self.db_path = get_cache_path()
         self._init_db()
@@ -30,14 +31,21 @@ class MetricsCache:
                         end_date DATE,
                         metric_data TEXT,
                         updated_at TIMESTAMP,
+                        version INTEGER NOT NULL DEFAULT 0,
                         PRIMARY KEY (user_id, metric_type, start_date, end_date)
                     )
                 """)
+                # Caches created before entries were tied to a transactions version
+                columns = {row[1] for row in conn.execute("PRAGMA table_info(metrics_cache)")}
+                if 'version' not in columns:
+                    conn.execute("ALTER TABLE metrics_cache ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
         except Exception as e:
             self.logger.error(f"Error in _init_db initializing metrics cache DB: {e}")
     
-    def get(self, user_id: str, metric_type: str, start_date: date, end_date: date) -> Optional[Dict]:
-        """Get cached metrics if not expired"""
+    def get(self, user_id: str, metric_type: str, start_date: date, end_date: date, version: int = 0) -> Optional[Dict]:
+        """Get cached metrics if not expired and computed from the given transactions version"""
+        if version < 0:
+            return None
         try:
             current_time = datetime.now()
             
@@ -45,6 +53,7 @@ class MetricsCache:
             cache_key = (user_id, metric_type, start_date, end_date)
             if (cache_key in self._memory_cache and 
                 cache_key in self._last_calc and
+                self._versions.get(cache_key) == version and
                 current_time - self._last_calc[cache_key] < self._cache_interval):
                 return self._memory_cache[cache_key]
             
@@ -54,14 +63,15 @@ class MetricsCache:
                     SELECT metric_data, updated_at 
                     FROM metrics_cache 
                     WHERE user_id = ? AND metric_type = ? 
-                    AND start_date = ? AND end_date = ?
-                """, (user_id, metric_type, start_date.isoformat(), end_date.isoformat()))
+                    AND start_date = ? AND end_date = ? AND version = ?
+                """, (user_id, metric_type, start_date.isoformat(), end_date.isoformat(), version))
                 
                 result = cursor.fetchone()
                 if result and (current_time - datetime.fromisoformat(result[1])) < self._cache_interval:
                     metric_data = json.loads(result[0])
                     self._memory_cache[cache_key] = metric_data
                     self._last_calc[cache_key] = datetime.fromisoformat(result[1])
+                    self._versions[cache_key] = version
                     return metric_data
                     
         except Exception as e:
@@ -69,8 +79,10 @@ class MetricsCache:
         
         return None
     
-    def set(self, user_id: str, metric_type: str, start_date: date, end_date: date, data: Dict):
-        """Cache metrics calculation result"""
+    def set(self, user_id: str, metric_type: str, start_date: date, end_date: date, data: Dict, version: int = 0):
+        """Cache metrics calculation result for a transactions version"""
+        if version < 0:
+            return
         try:
             current_time = datetime.now()
             cache_key = (user_id, metric_type, start_date, end_date)
@@ -78,20 +90,22 @@ class MetricsCache:
             # Update memory cache
             self._memory_cache[cache_key] = data
             self._last_calc[cache_key] = current_time
+            self._versions[cache_key] = version
             
             # Update database cache
             with sqlite3.connect(self.db_path) as conn:
                 conn.execute("""
                     INSERT OR REPLACE INTO metrics_cache 
-                    (user_id, metric_type, start_date, end_date, metric_data, updated_at)
-                    VALUES (?, ?, ?, ?, ?, ?)
+                    (user_id, metric_type, start_date, end_date, metric_data, updated_at, version)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
                 """, (
                     user_id, 
                     metric_type,
                     start_date.isoformat(),
                     end_date.isoformat(),
                     json.dumps(data),
-                    current_time.isoformat()
+                    current_time.isoformat(),
+                    version
                 ))
                 
         except Exception as e:
@@ -115,6 +129,7 @@ class MetricsCache:
                 k: v for k, v in self._last_calc.items()
                 if current_time - v < self._cache_interval
             }
+            self._versions = {k: v for k, v in self._versions.items() if k in self._last_calc}
             
         except Exception as e:
             self.logger.error(f"Error in clear_expired clearing expired cache: {e}")
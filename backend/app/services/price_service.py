@@ -1,9 +1,9 @@
-import yfinance as yf
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta, date
 import sqlite3
 import logging
+import threading
 import warnings
 import holidays
 from pathlib import Path
@@ -19,6 +19,10 @@ class PriceManager:
         self._memory_cache = {}
         self._last_download_time = {}
         self._download_interval = timedelta(days=365)
+        # Batch results shared by requests that ask for the same symbols and range
+        self._batch_cache = {}
+        self._batch_interval = timedelta(minutes=1)
+        self._batch_lock = threading.Lock()
         self.db_path = get_cache_path()
         self._init_db()
         self._us_holidays = holidays.US(years=range(2000, datetime.now().year + 2))
@@ -102,6 +106,25 @@ class PriceManager:
     
     def get_prices_batch(self, symbols: list, start_date: date, end_date: date) -> pd.DataFrame:
         """Get prices for multiple symbols and date range with caching"""
+        cache_key = (tuple(symbols), start_date, end_date)
+        with self._batch_lock:
+            cached = self._batch_cache.get(cache_key)
+        if cached is not None and datetime.now() - cached[1] < self._batch_interval:
+            return cached[0].copy()
+
+        prices_df = self._get_prices_batch(symbols, start_date, end_date)
+        if not prices_df.empty:
+            current_time = datetime.now()
+            with self._batch_lock:
+                self._batch_cache = {
+                    k: v for k, v in self._batch_cache.items()
+                    if current_time - v[1] < self._batch_interval
+                }
+                self._batch_cache[cache_key] = (prices_df, current_time)
+        return prices_df.copy()
+
+    def _get_prices_batch(self, symbols: list, start_date: date, end_date: date) -> pd.DataFrame:
+        """Get prices for multiple symbols and date range from the SQLite cache, downloading missing ones"""
         try:
             # Initialize result DataFrame
             prices_df = pd.DataFrame()
@@ -110,30 +133,33 @@ class PriceManager:
             # Get required trading days
             required_dates = self._get_trading_days(start_date, end_date)
             
-            # Check cache for each symbol
-            with sqlite3.connect(self.db_path) as conn:
-                for symbol in symbols:
-                    query = """
-                        SELECT date, price FROM price_cache 
-                        WHERE symbol = ? AND date BETWEEN ? AND ?
-                        ORDER BY date
-                    """
-                    df = pd.read_sql_query(
-                        query, 
+            # Read cached prices for all symbols in one query
+            if symbols:
+                with sqlite3.connect(self.db_path) as conn:
+                    placeholders = ", ".join("?" * len(symbols))
+                    cached_df = pd.read_sql_query(
+                        f"""
+                            SELECT symbol, date, price FROM price_cache 
+                            WHERE symbol IN ({placeholders}) AND date BETWEEN ? AND ?
+                            ORDER BY date
+                        """,
                         conn,
-                        params=(symbol, start_date.isoformat(), end_date.isoformat()),
+                        params=(*symbols, start_date.isoformat(), end_date.isoformat()),
                         parse_dates=['date']
                     )
-                    
-                    # Check if we have all required trading days
-                    if not df.empty:
-                        dates_covered = set(df['date'].dt.date)
+                cached_prices = cached_df.pivot(index='date', columns='symbol', values='price')
+                
+                # Check if we have all required trading days
+                covered_symbols = []
+                for symbol in symbols:
+                    if symbol in cached_prices.columns:
+                        dates_covered = set(cached_prices[symbol].dropna().index.date)
                         if required_dates.issubset(dates_covered):
-                            prices_df[symbol] = df.set_index('date')['price']
-                        else:
-                            symbols_to_download.append(symbol)
-                    else:
-                        symbols_to_download.append(symbol)
+                            covered_symbols.append(symbol)
+                            continue
+                    symbols_to_download.append(symbol)
+                if covered_symbols:
+                    prices_df = cached_prices[covered_symbols].rename_axis(columns=None)
             
             if symbols_to_download:
                 # Download missing data
@@ -146,14 +172,16 @@ class PriceManager:
                 if not downloaded_df.empty:
                     # Update cache with new data
                     current_time = datetime.now().isoformat()
+                    rows = [
+                        (symbol, idx.date().isoformat(), float(price), current_time)
+                        for symbol in symbols_to_download if symbol in downloaded_df.columns
+                        for idx, price in downloaded_df[symbol].items()
+                    ]
                     with sqlite3.connect(self.db_path) as conn:
-                        for symbol in symbols_to_download:
-                            if symbol in downloaded_df.columns:
-                                for idx, price in downloaded_df[symbol].items():
-                                    conn.execute(
-                                        "INSERT OR REPLACE INTO price_cache (symbol, date, price, updated_at) VALUES (?, ?, ?, ?)",
-                                        (symbol, idx.date().isoformat(), float(price), current_time)
-                                    )
+                        conn.executemany(
+                            "INSERT OR REPLACE INTO price_cache (symbol, date, price, updated_at) VALUES (?, ?, ?, ?)",
+                            rows
+                        )
                     
                     # Merge downloaded data with cached data
                     prices_df = pd.concat([prices_df, downloaded_df], axis=1)
@@ -174,6 +202,8 @@ class PriceManager:
             end_date = as_of_date + timedelta(days=1)
             start_date = as_of_date - timedelta(days=5)  # Buffer for holidays
 
+            import yfinance as yf  # Deferred, it is slow to import and only needed on a cache miss
+
             # Log yf.download parameters
             self.logger.info(f"Calling yf.download with params: symbol={symbol}, start={start_date}, end={end_date}, interval=1d")
             
@@ -205,6 +235,8 @@ class PriceManager:
             if not symbols:
                 return pd.DataFrame()
                 
+            import yfinance as yf  # Deferred, it is slow to import and only needed on a cache miss
+
             # Log yf.download parameters
             self.logger.info(f"Calling yf.download batch with params: symbols={symbols}, start={start_date}, end={end_date}, interval=1d")
 
@@ -5,6 +5,7 @@ import logging
 from typing import Dict, List, Optional, Tuple
 from pathlib import Path
 import sqlite3
+import threading
 from ..core.cache_config import get_cache_path
 
 logger = logging.getLogger(__name__)
@@ -16,7 +17,10 @@ class TransactionManager:
         self.logger = logging.getLogger(__name__)
         self._memory_cache = {}
         self._last_process_time = {}
-        self._process_interval = timedelta(days=365)
+        # Processed frames are rebuilt cheaply, so keep only recent ones for a bounded number of keys
+        self._process_interval = timedelta(minutes=10)
+        self._max_entries = 64
+        self._lock = threading.Lock()
         self.db_path = get_cache_path()
         self._init_db()
         
@@ -41,8 +45,8 @@ class TransactionManager:
         except Exception as e:
             self.logger.error(f"Error in _init_db initializing transaction cache DB: {e}")
     
-    def preprocess_transactions(self, df: pd.DataFrame, user_id: str = None) -> pd.DataFrame:
-        """Preprocess transactions with caching"""
+    def preprocess_transactions(self, df: pd.DataFrame, user_id: str = None, version: int = 0) -> pd.DataFrame:
+        """Preprocess transactions with caching, keyed on the user's transactions version"""
         try:
             if user_id is None:
                 self.logger.warning("No user_id provided for transaction processing")
@@ -52,30 +56,47 @@ class TransactionManager:
             if not isinstance(user_id, str):
                 user_id = str(user_id)
 
-            cache_key = (user_id, df.shape[0], df['date'].max())
+            cache_key = (user_id, version, df.shape[0], df['date'].max())
             current_time = datetime.now()
             
-            # Check memory cache
-            if (cache_key in self._memory_cache and 
-                cache_key in self._last_process_time and
-                current_time - self._last_process_time[cache_key] < self._process_interval):
-                return self._memory_cache[cache_key]
+            # Check memory cache, handing out copies since callers modify the frame
+            # A negative version means it could not be read, so skip the cache entirely
+            with self._lock:
+                if (version >= 0 and
+                    cache_key in self._memory_cache and 
+                    cache_key in self._last_process_time and
+                    current_time - self._last_process_time[cache_key] < self._process_interval):
+                    return self._memory_cache[cache_key].copy()
             
             # Process transactions
             processed_df = self._process_transactions(df)
             
             # Update cache
-            self._memory_cache[cache_key] = processed_df
-            self._last_process_time[cache_key] = current_time
+            if version >= 0:
+                with self._lock:
+                    self._memory_cache[cache_key] = processed_df
+                    self._last_process_time[cache_key] = current_time
+                    self._clear_expired(current_time)
             
             # Store running totals in SQLite
             self._store_running_totals(processed_df, user_id)
             
-            return processed_df
+            return processed_df.copy()
         except Exception as e:
             self.logger.error(f"Error in preprocess_transactions for user {user_id}: {e}")
             raise
     
+    def _clear_expired(self, current_time: datetime):
+        """Clear expired entries, then the oldest ones past the size bound; caller must hold the lock"""
+        for key in [k for k, v in self._last_process_time.items() if current_time - v >= self._process_interval]:
+            self._memory_cache.pop(key, None)
+            self._last_process_time.pop(key, None)
+        excess = len(self._memory_cache) - self._max_entries
+        if excess > 0:
+            for key in sorted(self._last_process_time, key=self._last_process_time.get)[:excess]:
+                self._memory_cache.pop(key, None)
+                self._last_process_time.pop(key, None)
+    
     def _process_transactions(self, df: pd.DataFrame) -> pd.DataFrame:
         """Process transactions with vectorized operations"""
         try:
@@ -163,6 +184,7 @@ class TransactionManager:
                 with sqlite3.connect(self.db_path) as conn:
                     # Prepare data for storage
                     cache_data = []
+                    updated_at = datetime.now().isoformat()
                     for symbol, group in df.groupby('stock'):
                         latest = group.iloc[-1]
                         # Convert date properly from index
@@ -182,7 +204,7 @@ class TransactionManager:
                             'realized_gl': 0.0,  # Calculate if needed
                             'dividend_income': 0.0,  # Calculate if needed
                             'option_gl': 0.0,  # Calculate if needed
-                            'updated_at': datetime.now().isoformat()
+                            'updated_at': updated_at
                         })
                     
                     # Store in database
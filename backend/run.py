@@ -0,0 +1,18 @@
+import os
+import uvicorn
+
+# Repository root, so the app imports as backend.app.main like it does under the uvicorn CLI
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if __name__ == "__main__":
+    # Run from the repository root: python backend/run.py
+    uvicorn.run(
+        "backend.app.main:app",
+        app_dir=ROOT_DIR,
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),
+        log_level="info"
+    )
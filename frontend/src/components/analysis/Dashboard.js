@@ -65,7 +65,7 @@ const Dashboard = () => {
                 
                 setHoldings(holdingsData);
                 setGainLoss(gainLossData);
-                const parsedAllocationData = JSON.parse(allocationData.data);
+                const parsedAllocationData = allocationData.data;
                 setAllocation({
                     chart_type: allocationData.chart_type,
                     values: parsedAllocationData.values,
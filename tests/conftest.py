@@ -2,7 +2,7 @@ import pytest
 import pandas as pd
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from backend.app.database import Base
+from backend.app.core.db import Base
 import os
 from typing import Dict, List
 
@@ -0,0 +1,49 @@
+import pytest
+import numpy as np
+import pandas as pd
+from datetime import date
+from backend.app.services.analysis_service import FinanceCalculator
+from backend.app.services.price_service import PriceManager
+
+TRANSACTIONS = pd.DataFrame({
+    'date': pd.to_datetime(['2023-01-03', '2023-01-04']),
+    'transaction_type': ['transfer', 'buy'],
+    'stock': ['CASH EQUIVALENTS', 'AAPL'],
+    'units': [1000.0, 10.0],
+    'price': [1.0, 50.0],
+    'fee': [0.0, 0.0],
+    'security_type': ['cash', 'stock'],
+    'amount': [1000.0, -500.0]
+})
+
+# Closes with a gap on Jan 11 and none before Jan 5
+PRICES = pd.DataFrame(
+    {'AAPL': [np.nan, 50.0, 51.0, 52.0, 54.0, np.nan, 56.0]},
+    index=pd.to_datetime([
+        '2023-01-04', '2023-01-05', '2023-01-06', '2023-01-09',
+        '2023-01-10', '2023-01-11', '2023-01-12'
+    ])
+)
+
+@pytest.fixture
+def calculator(tmp_path, monkeypatch):
+    """Calculator with its cache databases in a temporary directory and fixed prices"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(PriceManager, 'get_prices_batch', lambda self, symbols, start_date, end_date: PRICES.copy())
+    return FinanceCalculator()
+
+class TestHoldingsPrices:
+    def test_price_gap_uses_previous_close(self, calculator):
+        """Test that a date with a missing close is valued at the last known close."""
+        holdings = calculator.calculate_stock_holdings(TRANSACTIONS, start_date=date(2023, 1, 11), user_id='1')
+
+        assert holdings['AAPL']['last_price'] == 54.0
+        assert holdings['AAPL']['market_value'] == 540.0
+        assert sum(holding['weight'] for holding in holdings.values()) == pytest.approx(1.0)
+
+    def test_no_earlier_price_values_position_at_zero(self, calculator):
+        """Test that a position with no close on or before the date is valued at zero."""
+        holdings = calculator.calculate_stock_holdings(TRANSACTIONS, start_date=date(2023, 1, 4), user_id='1')
+
+        assert holdings['AAPL']['last_price'] == 0.0
+        assert holdings['AAPL']['market_value'] == 0.0
@@ -0,0 +1,140 @@
+import pytest
+import numpy as np
+import pandas as pd
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend.app.main import app
+from backend.app.core.db import Base, get_db
+from backend.app.models.transaction_model import Transaction
+from backend.app.services.cache_service import ResponseCache
+from backend.app.services.price_service import PriceManager
+from backend.app.api.endpoints import analysis_routes, file_routes, settings_routes
+
+SCHWAB_CSV = '''Date,Action,Symbol,Description,Quantity,Price,Fees & Comm,Amount
+01/05/2023,MoneyLink Transfer,,Deposit,,,,"$10,000.00"
+01/10/2023,Buy,AAPL,APPLE INC,10,$130.00,,"-$1,300.00"
+03/10/2023,Buy,MSFT,MICROSOFT,5,$250.00,,"-$1,250.00"
+06/10/2023,Sell,AAPL,APPLE INC,5,$180.00,,$900.00
+08/10/2023,Qualified Dividend,MSFT,MICROSOFT,,,,$5.00
+'''
+
+# A deposit inside the date range already covered by SCHWAB_CSV
+EXTRA_DEPOSIT = '04/03/2023,MoneyLink Transfer,,Deposit,,,,"$5,000.00"\n'
+
+def _fake_prices(self, symbols, start_date, end_date):
+    """Deterministic closing prices so tests don't need network access"""
+    index = pd.date_range(start_date, end_date, freq='B')
+    return pd.DataFrame(
+        {symbol: np.linspace(100, 120, len(index)) for symbol in symbols},
+        index=index
+    )
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """API client on a fresh database, with caches kept in a temporary directory"""
+    # Cache databases live under a relative path, so they follow the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(PriceManager, '_download_prices_batch', _fake_prices)
+    monkeypatch.setattr(PriceManager, '_download_single_price', lambda self, symbol, as_of_date: 100.0)
+
+    cache = ResponseCache()
+    for module in (analysis_routes, file_routes, settings_routes):
+        monkeypatch.setattr(module, 'response_cache', cache)
+    analysis_routes.get_calculator.cache_clear()
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def override_get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    test_client = TestClient(app)
+    test_client.session_factory = Session
+    yield test_client
+    app.dependency_overrides = {}
+    analysis_routes.get_calculator.cache_clear()
+    engine.dispose()
+
+@pytest.fixture
+def auth_headers(client):
+    """Sign up a test user and return its bearer token header"""
+    credentials = {'username': 'testuser', 'password': 'testpassword'}
+    assert client.post('/api/auth/signup', data=credentials).status_code == 200
+    response = client.post('/api/auth/login', data=credentials)
+    assert response.status_code == 200
+    return {'Authorization': f"Bearer {response.json()['access_token']}"}
+
+def _upload(client, headers, content):
+    return client.post(
+        '/api/upload',
+        files={'file': ('schwab.csv', content, 'text/csv')},
+        data={'broker': 'schwab'},
+        headers=headers
+    )
+
+def _transaction_count(client):
+    with client.session_factory() as db:
+        return db.query(Transaction).count()
+
+class TestUploadWorkflow:
+    def test_reupload_skips_existing_transactions(self, client, auth_headers):
+        """Test that uploading the same file again inserts no duplicates."""
+        assert _upload(client, auth_headers, SCHWAB_CSV).status_code == 200
+        count = _transaction_count(client)
+        assert count == 5
+
+        assert _upload(client, auth_headers, SCHWAB_CSV).status_code == 200
+        assert _transaction_count(client) == count
+
+        # Only the new row of an overlapping file is stored
+        assert _upload(client, auth_headers, SCHWAB_CSV + EXTRA_DEPOSIT).status_code == 200
+        assert _transaction_count(client) == count + 1
+
+    def test_performance_reflects_upload_within_date_range(self, client, auth_headers):
+        """Test that /performance is recomputed after an upload that keeps the same date range."""
+        assert _upload(client, auth_headers, SCHWAB_CSV).status_code == 200
+        before = client.get('/api/portfolio/performance', headers=auth_headers)
+        assert before.status_code == 200
+
+        assert _upload(client, auth_headers, SCHWAB_CSV + EXTRA_DEPOSIT).status_code == 200
+        after = client.get('/api/portfolio/performance', headers=auth_headers)
+        assert after.status_code == 200
+
+        assert after.headers['ETag'] != before.headers['ETag']
+        assert after.json()['dates'] == before.json()['dates']
+        assert after.json()['invested_amounts'][-1] == pytest.approx(before.json()['invested_amounts'][-1] + 5000)
+
+    def test_holdings_reflect_replaced_rows_with_same_count(self, client, auth_headers):
+        """Test that holdings are recomputed when rows are replaced without changing the row count."""
+        assert _upload(client, auth_headers, SCHWAB_CSV).status_code == 200
+        before = client.get('/api/portfolio/holdings', headers=auth_headers).json()
+        assert 'MSFT' in {holding['symbol'] for holding in before}
+
+        # Swap the MSFT buy for a GOOG buy, keeping the row count and last date
+        with client.session_factory() as db:
+            db.query(Transaction).filter(Transaction.stock == 'MSFT', Transaction.transaction_type == 'buy').delete()
+            db.commit()
+        replacement = SCHWAB_CSV.replace('03/10/2023,Buy,MSFT,MICROSOFT', '03/10/2023,Buy,GOOG,ALPHABET INC')
+        assert _upload(client, auth_headers, replacement).status_code == 200
+        assert _transaction_count(client) == 5
+
+        after = client.get('/api/portfolio/holdings', headers=auth_headers).json()
+        units = {holding['symbol']: holding['units'] for holding in after}
+        assert units['GOOG'] == 5
+        assert 'MSFT' not in units
+
+    def test_performance_revalidates_with_etag(self, client, auth_headers):
+        """Test that an unchanged /performance response is revalidated with a 304."""
+        assert _upload(client, auth_headers, SCHWAB_CSV).status_code == 200
+        first = client.get('/api/portfolio/performance', headers=auth_headers)
+        etag = first.headers['ETag']
+
+        second = client.get('/api/portfolio/performance', headers={**auth_headers, 'If-None-Match': etag})
+        assert second.status_code == 304